@@ -0,0 +1,84 @@
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import git_automation_core as core
+
+def make_changelog(path, target_bytes):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<databaseChangeLog xmlns="http://www.liquibase.org/xml/ns/dbchangelog">\n')
+        n = 0
+        while f.tell() < target_bytes:
+            n += 1
+            f.write(core.generate_changelog_entry(
+                "bench", f"{n:07d}", f"tables/T{n:07d}_up.sql", f"tables/T{n:07d}_down.sql", "Table"
+            ) + "\n")
+        f.write("</databaseChangeLog>\n")
+    return n
+
+def legacy_append(changelog_path, changelog_entry):
+    # The read-everything / re.sub / rewrite-everything version this replaced.
+    with open(changelog_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    new_content = re.sub(
+        r"\n*\s*</databaseChangeLog>",
+        f"\n{changelog_entry}\n</databaseChangeLog>",
+        content,
+    )
+    with open(changelog_path, "w", encoding="utf-8") as f:
+        f.write(new_content)
+
+def time_appends(fn, path, count):
+    started = time.perf_counter()
+    for n in range(count):
+        fn(path, core.generate_changelog_entry("bench", f"NEW{n}", "a_up.sql", "a_down.sql", "Table"))
+    return (time.perf_counter() - started) / count
+
+def main():
+    parser = argparse.ArgumentParser(description="Time append_to_changelog on a large synthetic changelog.")
+    parser.add_argument("--size-mb", type=float, default=50)
+    parser.add_argument("--appends", type=int, default=5)
+    parser.add_argument("--writers", type=int, default=8, help="threads for the concurrent append check")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_changelog_")
+    try:
+        master = os.path.join(work, "master.xml")
+        changesets = make_changelog(master, int(args.size_mb * 1024 * 1024))
+        print(f"Synthetic changelog: {os.path.getsize(master) / 1048576:.1f} MB, {changesets} changeSets")
+
+        legacy_copy = os.path.join(work, "legacy.xml")
+        shutil.copy(master, legacy_copy)
+        legacy = time_appends(legacy_append, legacy_copy, args.appends)
+        tail = time_appends(core.insert_changelog_entry, master, args.appends)
+        print(f"{'full rewrite (legacy)':<28} {legacy * 1000:10.2f} ms/append")
+        print(f"{'tail append':<28} {tail * 1000:10.2f} ms/append")
+        print(f"speedup: {legacy / tail:.0f}x")
+        with open(master, "rb") as f:
+            if f.read() != open(legacy_copy, "rb").read():
+                raise SystemExit("tail append and legacy append produced different files")
+
+        def writer(n):
+            core.insert_changelog_entry(master, f'<changeSet author="w" id="concurrent_{n}"/>')
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        with open(master, "rb") as f:
+            f.seek(-64 * 1024, os.SEEK_END)
+            tail_bytes = f.read()
+        found = sum(1 for n in range(args.writers) if f'id="concurrent_{n}"'.encode() in tail_bytes)
+        print(f"concurrent appends kept: {found}/{args.writers}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
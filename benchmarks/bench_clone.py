@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import git_automation_core as core
+
+def make_origin(path, files, commits, file_size):
+    # Builds a bare repo with a dev branch through git fast-import, which is
+    # far quicker than committing through a working tree.
+    subprocess.run(["git", "init", "-q", "--bare", path], check=True)
+    # Without these the server ignores --filter and a blobless clone is a full one.
+    subprocess.run(["git", "config", "uploadpack.allowFilter", "true"], cwd=path, check=True)
+    subprocess.run(["git", "config", "uploadpack.allowAnySHA1InWant", "true"], cwd=path, check=True)
+    lines = []
+    blob = os.urandom(file_size // 2).hex()
+    for c in range(commits):
+        message = f"commit {c}".encode()
+        lines.append(b"commit refs/heads/dev\n")
+        lines.append(b"committer Bench <bench@example.com> %d +0000\n" % (1700000000 + c))
+        lines.append(b"data %d\n%s\n" % (len(message), message))
+        touched = range(files) if c == 0 else range(c % files, files, max(1, files // 50))
+        for n in touched:
+            content = f"{c}:{n}:{blob}\n".encode()
+            lines.append(b"M 644 inline src/%03d/file_%06d.sql\n" % (n % 500, n))
+            lines.append(b"data %d\n%s\n" % (len(content), content))
+    subprocess.run(["git", "fast-import", "--quiet"], input=b"".join(lines), cwd=path, check=True)
+    subprocess.run(["git", "symbolic-ref", "HEAD", "refs/heads/dev"], cwd=path, check=True)
+
+def timed(label, fn):
+    started = time.perf_counter()
+    ok, out = fn()
+    elapsed = time.perf_counter() - started
+    if not ok:
+        raise SystemExit(f"{label} failed:\n{out}")
+    print(f"{label:<40} {elapsed:8.2f}s")
+    return elapsed
+
+def clone(url, tgt, mode, mirror):
+    ok, results = core.run_steps(core.clone_steps(url, tgt, mode, mirror))
+    return ok, results[-1][2] if results else ""
+
+def main():
+    parser = argparse.ArgumentParser(description="Time clone_repo with and without the mirror cache.")
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--commits", type=int, default=200)
+    parser.add_argument("--file-size", type=int, default=2000)
+    parser.add_argument("--keep", action="store_true", help="leave the fixture directory behind")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_clone_")
+    try:
+        origin = os.path.join(work, "origin.git")
+        print(f"Building fixture: {args.files} files, {args.commits} commits")
+        make_origin(origin, args.files, args.commits, args.file_size)
+        # file:// forces the pack protocol, like a real remote, instead of
+        # git's hardlinking shortcut for local paths.
+        url = "file://" + origin.replace("\\", "/")
+        cache_root = os.path.join(work, "cache")
+        mirror = core.mirror_path_for(url, cache_root)
+
+        baseline = timed("full clone, no mirror", lambda: clone(url, os.path.join(work, "c0"), "full", None))
+        timed("build mirror", lambda: core.update_mirror(url, cache_root))
+        timed(
+            "build mirror seeded from the full clone",
+            lambda: core.update_mirror(url, os.path.join(work, "cache_seeded"), os.path.join(work, "c0")),
+        )
+        timed("incremental mirror update", lambda: core.update_mirror(url, cache_root))
+        with_mirror = timed("full clone, with mirror", lambda: clone(url, os.path.join(work, "m_full"), "full", mirror))
+        # Blobless and shallow clones never borrow from the mirror.
+        for mode, _ in core.CLONE_MODES[1:]:
+            timed(f"{mode} clone", lambda: clone(url, os.path.join(work, f"n_{mode}"), mode, mirror))
+        print(f"full clone speedup from mirror: {baseline / with_mirror:.1f}x")
+    finally:
+        if args.keep:
+            print(f"Fixture kept in {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import datetime
+import statistics
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import git_automation_core as core
+from bench_clone import make_origin
+
+# name: (files, commits). "deep" is a long history over a small tree.
+REPO_SIZES = {"1k": (1000, 50), "50k": (50000, 20), "deep": (1000, 5000)}
+QUICK_REPO_SIZES = {"1k": (1000, 20), "deep": (200, 1000)}
+CHANGELOG_SIZES = (100, 1000, 10000, 100000)
+QUICK_CHANGELOG_SIZES = (100, 1000, 10000)
+DISCOVERY_REPOS = 200
+# Cumulative -X importtime of each module, which must also not load tkinter.
+IMPORT_MODULES = ("git_automation_core", "git_automation_app")
+IMPORT_TARGET_MS = 100
+
+def measure(fn, repeat, setup=None):
+    times = []
+    for n in range(repeat):
+        arg = setup(n) if setup else None
+        started = time.perf_counter()
+        fn(arg) if setup else fn()
+        times.append(time.perf_counter() - started)
+    return times
+
+def summarize(name, params, times):
+    row = {
+        "name": name, "params": params, "repeat": len(times),
+        "min": min(times), "median": statistics.median(times), "mean": statistics.fmean(times), "max": max(times),
+    }
+    label = name + "".join(f" {k}={v}" for k, v in params.items())
+    print(f"{label:<70} median {row['median'] * 1000:10.2f} ms   min {row['min'] * 1000:10.2f} ms")
+    return row
+
+def check(ok_out):
+    ok, out = ok_out
+    if not ok:
+        raise SystemExit(out)
+
+def bench_git(work, sizes, repeat):
+    rows = []
+    for size, (files, commits) in sizes.items():
+        origin = os.path.join(work, f"origin_{size}.git")
+        print(f"Building origin {size}: {files} files, {commits} commits")
+        make_origin(origin, files, commits, 200)
+        clone = os.path.join(work, f"clone_{size}")
+        check(core.run_cmd(["git", "clone", "-q", "--branch", "dev", "file://" + origin.replace("\\", "/"), clone]))
+        params = {"repo": size, "files": files, "commits": commits}
+        fetch = ["git", "fetch", "--no-tags", "origin", "+refs/heads/dev:refs/remotes/origin/dev"]
+        rows.append(summarize("git fetch (up to date)", params, measure(lambda: check(core.run_cmd(fetch, clone)), repeat)))
+        rows.append(summarize(
+            "git checkout -f -B dev origin/dev", params,
+            measure(lambda: check(core.run_cmd(["git", "checkout", "-q", "-f", "-B", "dev", "origin/dev"], clone)), repeat),
+        ))
+        rows.append(summarize(
+            "git reset --hard origin/dev", params,
+            measure(lambda: check(core.run_cmd(["git", "reset", "-q", "--hard", "origin/dev"], clone)), repeat),
+        ))
+        rows.append(summarize(
+            "git checkout -b <story>", params,
+            measure(
+                lambda branch: check(core.run_cmd(["git", "checkout", "-q", "-b", branch], clone)), repeat,
+                setup=lambda n: f"bench_{n}",
+            ),
+        ))
+        touched = [os.path.join(clone, "src", f"{n % 500:03d}", f"file_{n:06d}.sql") for n in range(0, files, max(1, files // 20))]
+        for path in touched:
+            with open(path, "a") as f:
+                f.write("-- bench\n")
+        rows.append(summarize(
+            "git_get_modified_files", dict(params, modified=len(touched)),
+            measure(lambda: core.git_get_modified_files(clone), repeat),
+        ))
+        check(core.run_cmd(["git", "checkout", "-q", "-f", "dev"], clone))
+    return rows
+
+def make_changelog_entries(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<databaseChangeLog xmlns="http://www.liquibase.org/xml/ns/dbchangelog">\n')
+        for n in range(count):
+            f.write(core.generate_changelog_entry(
+                "bench", f"{n:07d}", f"tables/T{n:07d}_up.sql", f"tables/T{n:07d}_down.sql", "Table", f"{n:07d}"
+            ) + "\n")
+        f.write("</databaseChangeLog>\n")
+
+def bench_changelog(work, sizes, repeat):
+    rows = []
+    rows.append(summarize(
+        "generate_changelog_entry x1000", {},
+        measure(lambda: [core.generate_changelog_entry("u", "S-1", "a_up.sql", "a_down.sql", "Table", str(n)) for n in range(1000)], repeat),
+    ))
+    for count in sizes:
+        path = os.path.join(work, f"changelog_{count}.xml")
+        make_changelog_entries(path, count)
+        params = {"changesets": count, "mb": round(os.path.getsize(path) / 1048576, 1)}
+        entry = core.generate_changelog_entry("bench", "NEW", "new_up.sql", "new_down.sql", "Table")
+        rows.append(summarize("append_to_changelog", params, measure(lambda: core.append_to_changelog(path, entry), repeat)))
+        rows.append(summarize(
+            "resolve_changeset_id (index rebuild)", params,
+            measure(
+                lambda _: core.resolve_changeset_id(path, "0000001", "bench", ["tables/T0000001_up.sql"]), repeat,
+                setup=lambda n: os.remove(core.changelog_index_path(path)) if os.path.exists(core.changelog_index_path(path)) else None,
+            ),
+        ))
+        rows.append(summarize(
+            "resolve_changeset_id (indexed)", params,
+            measure(lambda: core.resolve_changeset_id(path, "0000001", "bench", ["tables/T0000001_up.sql"]), repeat),
+        ))
+        with open(path, "rb") as f:
+            base = f.read()
+        def checkout_base(n):
+            # A story appends, then the checkout puts the base version back.
+            core.insert_changelog_entry(path, entry)
+            core.resolve_changeset_id(path, "0000001", "bench", [])
+            with open(path, "wb") as f:
+                f.write(base)
+        rows.append(summarize(
+            "resolve_changeset_id (after base checkout)", params,
+            measure(
+                lambda _: core.resolve_changeset_id(path, "0000001", "bench", ["tables/T0000001_up.sql"]), repeat,
+                setup=checkout_base,
+            ),
+        ))
+    return rows
+
+def make_workspace(folder, repos):
+    # Repos spread over a few nesting levels, with noise folders in between.
+    for n in range(repos):
+        repo = os.path.join(folder, f"team{n % 7}", f"group{n % 5}", f"repo{n:04d}")
+        os.makedirs(os.path.join(repo, ".git"))
+        with open(os.path.join(repo, ".git", "HEAD"), "w") as f:
+            f.write("ref: refs/heads/dev\n")
+        os.makedirs(os.path.join(folder, f"team{n % 7}", f"docs{n % 3}", "notes"), exist_ok=True)
+        os.makedirs(os.path.join(folder, f"team{n % 7}", "node_modules", f"pkg{n}"), exist_ok=True)
+
+def bench_discovery(work, repos, repeat):
+    folder = os.path.join(work, "workspace")
+    make_workspace(folder, repos)
+    params = {"repos": repos}
+    rows = [summarize("scan_repos (cold)", params, measure(lambda: core.scan_repos(folder), repeat))]
+    previous = core.scan_repos(folder)
+    rows.append(summarize("scan_repos (incremental)", params, measure(lambda: core.scan_repos(folder, previous=previous), repeat)))
+    return rows
+
+def import_seconds(module):
+    root = os.path.dirname(os.path.abspath(core.__file__))
+    code = f"import sys, {module}; sys.exit('tkinter' in sys.modules)"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=root, capture_output=True, text=True)
+    if proc.returncode:
+        raise SystemExit(f"import {module} failed or loaded tkinter:\n{proc.stderr[-2000:]}")
+    for line in proc.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    raise SystemExit(f"no importtime line for {module}")
+
+def bench_import(repeat):
+    rows = []
+    for module in IMPORT_MODULES:
+        import_seconds(module)  # warm the bytecode cache
+        row = summarize("import", {"module": module}, [import_seconds(module) for _ in range(repeat)])
+        row["target_ms"] = IMPORT_TARGET_MS
+        row["over_target"] = row["median"] * 1000 > IMPORT_TARGET_MS
+        rows.append(row)
+    return rows
+
+def environment():
+    git_version = subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip()
+    head = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(core.__file__)),
+        capture_output=True, text=True,
+    ).stdout.strip()
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": head or None, "python": platform.python_version(), "git": git_version,
+        "platform": platform.platform(), "machine": platform.machine(), "cpus": os.cpu_count(),
+    }
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path} (median, >1.00x is slower now):")
+    for r in results:
+        old = baseline.get((r["name"], json.dumps(r["params"], sort_keys=True)))
+        if old and old["median"] > 0:
+            label = r["name"] + "".join(f" {k}={v}" for k, v in r["params"].items())
+            ratio = r["median"] / old["median"]
+            flag = "  <-- slower" if ratio > 1.2 else ""
+            print(f"{label:<70} {old['median'] * 1000:10.2f} -> {r['median'] * 1000:10.2f} ms  {ratio:5.2f}x{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every pipeline stage against local synthetic fixtures.")
+    parser.add_argument("--quick", action="store_true", help="smaller fixtures, for a fast smoke run")
+    parser.add_argument("--only", choices=["import", "git", "changelog", "discovery"], action="append",
+                        help="run only these groups (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="results JSON (default: bench_results_<timestamp>.json in the temp dir)")
+    parser.add_argument("--compare", metavar="BASELINE", help="print the change against an earlier results JSON")
+    parser.add_argument("--keep", action="store_true", help="leave the fixture directory behind")
+    args = parser.parse_args()
+    groups = args.only or ["import", "git", "changelog", "discovery"]
+
+    work = tempfile.mkdtemp(prefix="bench_suite_")
+    results = []
+    try:
+        if "import" in groups:
+            results += bench_import(args.repeat)
+        if "git" in groups:
+            results += bench_git(work, QUICK_REPO_SIZES if args.quick else REPO_SIZES, args.repeat)
+        if "changelog" in groups:
+            results += bench_changelog(work, QUICK_CHANGELOG_SIZES if args.quick else CHANGELOG_SIZES, args.repeat)
+        if "discovery" in groups:
+            results += bench_discovery(work, DISCOVERY_REPOS // 4 if args.quick else DISCOVERY_REPOS, args.repeat)
+    finally:
+        if args.keep:
+            print(f"Fixtures kept in {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    # Never default into the cwd, which is usually the repo checkout.
+    output = args.output or os.path.join(
+        tempfile.gettempdir(), f"bench_results_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"format": 1, "environment": environment(), "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+    slow = [r["params"]["module"] for r in results if r.get("over_target")]
+    if slow:
+        print(f"Import time over the {IMPORT_TARGET_MS} ms target: {', '.join(slow)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,99 +1,35 @@
 import os
 import subprocess
-import shutil
-import tkinter as tk
-from tkinter import messagebox, simpledialog, filedialog
+import threading
+import queue
+import collections
 import datetime
-import json
-import re
-import webbrowser
-import platform
+import sys
+from git_automation_core import (
+    CLONE_MODES, CommandWorker, DEFAULT_SHARD_MAX_BYTES, DuplicateChangeSetError, InvalidChangelogError,
+    OBJECT_TYPES, Prefetcher, REPO_SCAN_DEPTH, RESULT_COLUMNS, acquire_worktree_slot, append_to_changelog,
+    cache_dir, changelog_family, changelog_sql_paths, cli_main, clone_steps, commit_message, commit_push_steps,
+    configure_tracing, default_changeset_id, describe_age, describe_changes, describe_differing, describe_preflight,
+    describe_sql_conflicts, dev_fetch_step, execute_copies, filter_repos, find_repo_name_from_url,
+    format_results_table, generate_changelog_entry, get_github_pr_url, git_add_step, indexed_repos, is_inside,
+    load_config, map_to_workdir, mirror_path_for, new_trace, normalize_manifest_entry, pair_migration_files,
+    parse_status_v2, plan_copies, prefetch_settings, preflight_totals, prepare_branch_steps, push_queue,
+    refresh_repo_index, release_worktree_slot, resolve_changeset_ids, result_outcome, run_manifest, run_preflight,
+    save_config, shard_target, spawn_stats, start_mirror_update, status_options, status_step, story_branch_name,
+    story_settings, trace_span, worktree_branch_steps,
+)
 
-CONFIG_FILE = "config.json"
+# tkinter (and the modules only the GUI needs) load in load_tk(), when the
+# GUI actually starts, so headless runs never pay for them or need a display.
+tk = messagebox = simpledialog = filedialog = ttk = None
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
-    return {}
-
-def save_config(data):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump(data, f)
-
-def run_cmd(cmd, cwd=None):
-    try:
-        result = subprocess.run(cmd, cwd=cwd, shell=True, capture_output=True, text=True)
-        return result.returncode == 0, result.stdout + result.stderr
-    except Exception as e:
-        return False, str(e)
-
-def find_repo_name_from_url(url):
-    m = re.search(r"/([^/]+?)(?:\.git)?$", url)
-    if m:
-        return m.group(1)
-    return "cloned_repo"
-
-def generate_changelog_entry(author, story_id, up_file, down_file, obj_type):
-    date_part = datetime.datetime.now().strftime("%Y%m%d")
-    comment = story_id
-    up_file = up_file.replace("\\", "/")
-    down_file = down_file.replace("\\", "/")
-    if obj_type == "Table":
-        changelog = (
-            f'<changeSet author="{author}" id="{date_part}_{story_id}">\n'
-            f'    <comment>{comment}</comment>\n'
-            f'    <sqlFile path="{up_file}" relativeToChangelogFile="true"/>\n'
-            f'    <rollback>\n'
-            f'        <sqlFile path="{down_file}" relativeToChangelogFile="true"/>\n'
-            f'    </rollback>\n'
-            f'</changeSet>'
-        )
-    elif obj_type in ("View", "Procedure"):
-        changelog = (
-            f'<changeSet author="{author}" id="{date_part}_{story_id}" runOnChange="true" runInTransaction="true">\n'
-            f'    <comment>{comment}</comment>\n'
-            f'    <sqlFile path="{up_file}" endDelimiter="" encoding="UTF-8"/>\n'
-            f'    <rollback>\n'
-            f'        <sqlFile path="{down_file}" relativeToChangelogFile="true"/>\n'
-            f'    </rollback>\n'
-            f'</changeSet>'
-        )
-    else:
-        changelog = (
-            f'<changeSet author="{author}" id="{date_part}_{story_id}">\n'
-            f'    <comment>{comment}</comment>\n'
-            f'    <sqlFile path="{up_file}" relativeToChangelogFile="true"/>\n'
-            f'    <rollback>\n'
-            f'        <sqlFile path="{down_file}" relativeToChangelogFile="true"/>\n'
-            f'    </rollback>\n'
-            f'</changeSet>'
-        )
-    return changelog
-
-def append_to_changelog(changelog_path, changelog_entry):
-    try:
-        with open(changelog_path, "r", encoding="utf-8") as f:
-            content = f.read()
-        if "</databaseChangeLog>" not in content:
-            messagebox.showerror(
-                "Invalid changelog",
-                "Selected file is not a valid changelog XML (missing </databaseChangeLog> tag).",
-            )
-            return False
-        new_content = re.sub(
-            r"\n*\s*</databaseChangeLog>",
-            f"\n{changelog_entry}\n</databaseChangeLog>",
-            content,
-        )
-        with open(changelog_path, "w", encoding="utf-8") as f:
-            f.write(new_content)
-        return True
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to update changelog file:\n{e}")
-        return False
+def load_tk():
+    global tk, messagebox, simpledialog, filedialog, ttk
+    import tkinter as tk
+    from tkinter import messagebox, simpledialog, filedialog, ttk
 
 def open_file_in_editor(path):
+    import platform
     try:
         if platform.system() == "Windows":
             os.startfile(path)
@@ -104,19 +40,6 @@ def open_file_in_editor(path):
     except Exception as e:
         messagebox.showerror("Open Error", f"Could not open file:\n{e}")
 
-def git_get_modified_files(repo_path):
-    success, output = run_cmd("git status --porcelain", cwd=repo_path)
-    if not success:
-        return []
-    files = []
-    for line in output.splitlines():
-        if not line.strip():
-            continue
-        filename = line[3:].strip() if len(line) > 3 else ""
-        if filename:
-            files.append(filename)
-    return files
-
 def show_db_object_type_dialog(parent):
     dialog = tk.Toplevel(parent)
     dialog.title("Select DB Object Type")
@@ -154,17 +77,89 @@ def show_db_object_type_dialog(parent):
     else:
         return None
 
-def get_github_pr_url(repo_path, branch):
-    success, out = run_cmd("git config --get remote.origin.url", cwd=repo_path)
-    if success and out.strip():
-        url = out.strip()
-        match = re.search(r"github\.com[/:](.+?)/(.+?)(?:\.git)?$", url)
-        if match:
-            owner, repository = match.group(1), match.group(2)
-            return f"https://github.com/{owner}/{repository}/pull/new/{branch}"
-    return None
+def show_object_types_dialog(parent, names):
+    # One object type per migration pair, for stories that add several.
+    dialog = tk.Toplevel(parent)
+    dialog.title("Select DB Object Types")
+    dialog.resizable(False, False)
+    dialog.grab_set()
+
+    tk.Label(dialog, text="Select the DB Object Type of each migration:", font=("Arial", 12, "bold")).pack(
+        padx=20, pady=10
+    )
+    grid = tk.Frame(dialog)
+    grid.pack(padx=20)
+    set_all = tk.StringVar(value="Table")
+    tk.Label(grid, text="All", font=("Arial", 11, "bold")).grid(row=0, column=0, sticky=tk.W, pady=2)
+    ttk.Combobox(grid, textvariable=set_all, values=OBJECT_TYPES, state="readonly", width=12).grid(
+        row=0, column=1, padx=10, pady=2
+    )
+    selected = []
+    for row, name in enumerate(names, 1):
+        var = tk.StringVar(value="Table")
+        tk.Label(grid, text=name, font=("Arial", 11)).grid(row=row, column=0, sticky=tk.W, pady=2)
+        ttk.Combobox(grid, textvariable=var, values=OBJECT_TYPES, state="readonly", width=12).grid(
+            row=row, column=1, padx=10, pady=2
+        )
+        selected.append(var)
+    set_all.trace_add("write", lambda *_: [var.set(set_all.get()) for var in selected])
+
+    confirmed = {"ok": False}
+    def on_ok():
+        confirmed["ok"] = True
+        dialog.destroy()
+    def on_cancel():
+        dialog.destroy()
+
+    btn_frame = tk.Frame(dialog)
+    btn_frame.pack(pady=15)
+    btn_ok = tk.Button(btn_frame, text="OK", width=12, command=on_ok)
+    btn_ok.pack(side=tk.LEFT, padx=10)
+    btn_cancel = tk.Button(btn_frame, text="Cancel", width=12, command=on_cancel)
+    btn_cancel.pack(side=tk.LEFT, padx=10)
+
+    parent.wait_window(dialog)
+    if confirmed["ok"]:
+        return [var.get() for var in selected]
+    else:
+        return None
+
+def show_clone_mode_dialog(parent, default="full"):
+    dialog = tk.Toplevel(parent)
+    dialog.title("Clone Options")
+    dialog.resizable(False, False)
+    dialog.grab_set()
+    selected = tk.StringVar(value=default)
+
+    tk.Label(dialog, text="How much history should be cloned?", font=("Arial", 12, "bold")).pack(
+        padx=20, pady=10
+    )
+    for mode, label in CLONE_MODES:
+        rb = tk.Radiobutton(dialog, text=label, variable=selected, value=mode, font=("Arial", 11))
+        rb.pack(anchor="w", padx=40, pady=2)
+
+    confirmed = {"ok": False}
+    def on_ok():
+        confirmed["ok"] = True
+        dialog.destroy()
+    def on_cancel():
+        dialog.destroy()
+
+    btn_frame = tk.Frame(dialog)
+    btn_frame.pack(pady=15)
+    btn_ok = tk.Button(btn_frame, text="OK", width=12, command=on_ok)
+    btn_ok.pack(side=tk.LEFT, padx=10)
+    btn_cancel = tk.Button(btn_frame, text="Cancel", width=12, command=on_cancel)
+    btn_cancel.pack(side=tk.LEFT, padx=10)
+
+    parent.wait_window(dialog)
+    if confirmed["ok"]:
+        return selected.get()
+    else:
+        return None
 
 def show_pr_popup(parent, url):
+    import webbrowser
     popup = tk.Toplevel(parent)
     popup.title("Create Pull Request")
     popup.resizable(False, False)
@@ -177,12 +172,168 @@ def show_pr_popup(parent, url):
         popup.destroy()
     link.bind("<Button-1>", open_url)
 
+def show_fan_out_results(parent, results):
+    import webbrowser
+    popup = tk.Toplevel(parent)
+    popup.title("Fan-out Results")
+    ok = sum(1 for r in results if r["status"] == "ok")
+    tk.Label(popup, text=f"{ok} of {len(results)} repositories succeeded", font=("Arial", 12, "bold")).pack(
+        padx=10, pady=(10, 5)
+    )
+    tree = ttk.Treeview(popup, columns=[key for key, _ in RESULT_COLUMNS], show="headings", height=min(len(results), 15))
+    for key, label in RESULT_COLUMNS:
+        tree.heading(key, text=label)
+        tree.column(key, width=380 if key in ("repo", "pr_url") else 90, stretch=key in ("repo", "pr_url"))
+    tree.tag_configure("failed", foreground="red")
+    for r in results:
+        tree.insert(
+            "", tk.END, values=(r["repo"], r["status"], r["branch"], result_outcome(r)),
+            tags=() if r["status"] == "ok" else ("failed",),
+        )
+    tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+    tk.Label(popup, text="Double-click a row to open its pull request", fg="gray").pack(pady=(0, 10))
+    def open_pr(event):
+        row = tree.focus()
+        url = results[tree.index(row)]["pr_url"] if row else None
+        if url:
+            webbrowser.open(url)
+    tree.bind("<Double-Button-1>", open_pr)
+
+LOG_VIEW_LINES = 2000
+LOG_FRAME_MS = 100
+SESSION_LOGS_KEEP = 20
+
+def session_log_path(cache_root):
+    # One log file per app session under <cache_dir>/logs; only the newest
+    # SESSION_LOGS_KEEP are kept.
+    folder = os.path.join(cache_root, "logs")
+    os.makedirs(folder, exist_ok=True)
+    old = sorted(n for n in os.listdir(folder) if n.startswith("session-") and n.endswith(".log"))
+    for name in old[:max(0, len(old) - SESSION_LOGS_KEEP + 1)]:
+        try:
+            os.remove(os.path.join(folder, name))
+        except OSError:
+            pass
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(folder, f"session-{stamp}-{os.getpid()}.log")
+
+class LogView:
+    # Output pane that keeps only the last max_lines lines in the Text
+    # widget. Lines are queued by write() and inserted once per frame; every
+    # line also goes to the session log file, which holds the full history.
+    def __init__(self, parent, log_path, max_lines=LOG_VIEW_LINES, frame_ms=LOG_FRAME_MS):
+        self.log_path = log_path
+        self.max_lines = max_lines
+        self.frame_ms = frame_ms
+        self.pending = collections.deque()
+        self.skipped = 0
+        self._log = None
+        self._search_from = "1.0"
+
+        self.frame = tk.Frame(parent)
+        bar = tk.Frame(self.frame)
+        bar.pack(fill=tk.X, pady=(0, 3))
+        self.search_text = tk.StringVar()
+        ent_search = tk.Entry(bar, textvariable=self.search_text, width=30)
+        ent_search.pack(side=tk.LEFT)
+        ent_search.bind("<Return>", lambda event: self.find_next())
+        tk.Button(bar, text="Find", command=self.find_next).pack(side=tk.LEFT, padx=5)
+        self.label_search = tk.Label(bar, text="", fg="gray")
+        self.label_search.pack(side=tk.LEFT, padx=5)
+        tk.Button(bar, text="Open full log", command=self.open_full_log).pack(side=tk.RIGHT)
+        self.text = tk.Text(self.frame, height=20)
+        scrollbar = tk.Scrollbar(self.frame, command=self.text.yview)
+        self.text.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(fill=tk.BOTH, expand=True)
+        self.text.tag_configure("match", background="yellow")
+        self.frame.after(self.frame_ms, self._flush)
+
+    def write(self, text):
+        if self._log is None:
+            try:
+                self._log = open(self.log_path, "a", encoding="utf-8")
+            except OSError:
+                self._log = False
+        if self._log:
+            self._log.write(text if text.endswith("\n") else text + "\n")
+        self.pending.extend(text.splitlines())
+        # Whatever would be trimmed right after insertion is never inserted;
+        # one line is left for the "lines only in the full log" marker.
+        while len(self.pending) > self.max_lines - 1:
+            self.pending.popleft()
+            self.skipped += 1
+
+    def _flush(self):
+        if self.pending:
+            lines = list(self.pending)
+            self.pending.clear()
+            if self.skipped:
+                lines.insert(0, f"... {self.skipped} lines only in the full log ...")
+                self.skipped = 0
+            follow = self.text.yview()[1] >= 0.999
+            self.text.insert(tk.END, "\n".join(lines) + "\n")
+            excess = int(self.text.index("end-1c").split(".")[0]) - 1 - self.max_lines
+            if excess > 0:
+                self.text.delete("1.0", f"{excess + 1}.0")
+            if follow:
+                self.text.see(tk.END)
+        if self._log:
+            self._log.flush()
+        self.frame.after(self.frame_ms, self._flush)
+
+    def find_next(self):
+        pattern = self.search_text.get()
+        self.text.tag_remove("match", "1.0", tk.END)
+        if not pattern:
+            self.label_search.config(text="")
+            return
+        pos = self.text.search(pattern, self._search_from, stopindex=tk.END, nocase=True)
+        if not pos and self._search_from != "1.0":
+            pos = self.text.search(pattern, "1.0", stopindex=tk.END, nocase=True)
+        if pos:
+            end = f"{pos}+{len(pattern)}c"
+            self.text.tag_add("match", pos, end)
+            self.text.see(pos)
+            self._search_from = end
+            self.label_search.config(text="")
+            return
+        self._search_from = "1.0"
+        count = self.count_in_full_log(pattern)
+        if count:
+            self.label_search.config(text=f"Not in view; {count} match(es) in the full log")
+        else:
+            self.label_search.config(text="No matches")
+
+    def count_in_full_log(self, pattern):
+        if self._log:
+            self._log.flush()
+        pattern = pattern.lower()
+        count = 0
+        try:
+            with open(self.log_path, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    count += line.lower().count(pattern)
+        except OSError:
+            return 0
+        return count
+
+    def open_full_log(self):
+        if self._log:
+            self._log.flush()
+        if os.path.exists(self.log_path):
+            open_file_in_editor(self.log_path)
+        else:
+            messagebox.showinfo("Log", "Nothing has been logged yet.")
+
 def main():
+    load_tk()
     root = tk.Tk()
     root.title("Git Automation App")
     root.geometry("750x400")
 
     config = load_config()
+    configure_tracing(config)
     if not config.get("username"):
         username = simpledialog.askstring("Setup", "Enter your username (for tracking):", parent=root)
         if not username:
@@ -221,6 +372,10 @@ def main():
     btn_select.pack(side=tk.LEFT, padx=5)
     label_repo = tk.Label(root, text="No repository selected", relief=tk.SUNKEN)
     label_repo.pack(fill=tk.X, padx=10, pady=5)
+    label_fresh = tk.Label(root, text="", fg="gray")
+    label_fresh.pack(fill=tk.X, padx=10)
+    label_pushes = tk.Label(root, text="", fg="darkorange")
+    label_pushes.pack(fill=tk.X, padx=10)
 
     wf_frame = tk.LabelFrame(root, text="Select Workflow Mode")
     wf_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -228,6 +383,11 @@ def main():
     rb_db.pack(anchor=tk.W, padx=10, pady=2)
     rb_ge = tk.Radiobutton(wf_frame, text="GE Scripts", variable=workflow_mode, value="GE Scripts")
     rb_ge.pack(anchor=tk.W, padx=10, pady=2)
+    use_worktree = tk.BooleanVar(value=config.get("use_worktrees", False))
+    cb_worktree = tk.Checkbutton(
+        wf_frame, text="Run in a separate worktree (leave my checkout untouched)", variable=use_worktree
+    )
+    cb_worktree.pack(anchor=tk.W, padx=10, pady=2)
 
     input_frame = tk.Frame(root)
     input_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -241,11 +401,20 @@ def main():
     ent_commit = tk.Entry(input_frame, width=50)
     ent_commit.grid(row=2, column=1, pady=3, sticky=tk.W)
 
-    btn_start = tk.Button(root, text="Start Automation", state=tk.DISABLED)
-    btn_start.pack(pady=10)
+    action_frame = tk.Frame(root)
+    action_frame.pack(pady=10)
+    btn_start = tk.Button(action_frame, text="Start Automation", state=tk.DISABLED)
+    btn_start.pack(side=tk.LEFT, padx=5)
+    btn_fan_out = tk.Button(action_frame, text="Fan Out to Repos...")
+    btn_fan_out.pack(side=tk.LEFT, padx=5)
+    btn_cancel = tk.Button(action_frame, text="Cancel", state=tk.DISABLED)
+    btn_cancel.pack(side=tk.LEFT, padx=5)
     status_label = tk.Label(root, text="", fg="blue")
     status_label.pack(fill=tk.X)
-    output_text = tk.Text(root, height=20)
+    log_view = LogView(
+        root, session_log_path(cache_dir(config)),
+        config.get("log_view_lines", LOG_VIEW_LINES), config.get("log_frame_ms", LOG_FRAME_MS),
+    )
 
     def update_branch_name(*args):
         story = ent_story.get().strip()
@@ -256,14 +425,128 @@ def main():
             ent_branch.delete(0, tk.END)
     ent_story.bind("<KeyRelease>", update_branch_name)
 
+    active_workers = []
+    fan_outs = []
+    prefetch_interval, prefetch_max_age = prefetch_settings(config)
+    prefetcher = Prefetcher(prefetch_interval) if config.get("prefetch", True) else None
+    pushes = push_queue(config)
+    push_events = queue.Queue()
+    pushes.start(on_change=push_events.put)
+
+    def update_freshness():
+        if prefetcher and repo_path:
+            age = prefetcher.age(repo_path)
+            error = prefetcher.last_error.get(os.path.normcase(os.path.abspath(repo_path)))
+            if error:
+                label_fresh.config(text="origin/dev: background fetch failed", fg="red")
+            elif age is None:
+                label_fresh.config(text="origin/dev: fetching in background...", fg="gray")
+            else:
+                label_fresh.config(
+                    text=f"origin/dev: fetched {describe_age(age)}",
+                    fg="darkgreen" if age <= prefetch_max_age else "gray",
+                )
+        root.after(5000, update_freshness)
+
+    def update_push_status():
+        while True:
+            try:
+                outcomes = push_events.get_nowait()
+            except queue.Empty:
+                break
+            for outcome in outcomes:
+                if outcome["ok"]:
+                    pr_link = get_github_pr_url(outcome["repo"], outcome["branch"])
+                    log_view.write(f"Queued push of {outcome['branch']} succeeded" + (f": {pr_link}" if pr_link else ""))
+                else:
+                    log_view.write(f"Queued push of {outcome['branch']} failed again: {outcome['error']}")
+        try:
+            pending = pushes.pending()
+        except OSError:
+            pending = []
+        label_pushes.config(text=f"{len(pending)} push(es) queued for retry" if pending else "")
+        root.after(5000, update_push_status)
+
     def enable_start():
-        if repo_path:
-            btn_start.config(state=tk.NORMAL)
-        else:
-            btn_start.config(state=tk.DISABLED)
+        idle = (not active_workers and not fan_outs) or use_worktree.get()
+        btn_start.config(state=tk.NORMAL if repo_path and idle else tk.DISABLED)
+        btn_fan_out.config(state=tk.NORMAL if idle and not fan_outs else tk.DISABLED)
+
+    def on_worktree_toggle():
+        config["use_worktrees"] = use_worktree.get()
+        save_config(config)
+        enable_start()
+    cb_worktree.config(command=on_worktree_toggle)
+
+    def run_in_background(steps, on_success, run=None, trace=None):
+        worker = CommandWorker()
+        active_workers.append((worker, run))
+        enable_start()
+        btn_cancel.config(state=tk.NORMAL)
+        worker.run(steps, on_success, trace or (run or {}).get("trace"))
+
+    def call_in_background(func, on_success, run, status):
+        # Python work that can take seconds (hashing, changelog index builds)
+        # runs on a worker too; on_success gets its result, or the exception
+        # it raised, back on the Tk thread, which only shows the dialogs.
+        status_label.config(text=status)
+        worker = CommandWorker()
+        active_workers.append((worker, run))
+        enable_start()
+        worker.call(func, on_success)
+
+    def cancel_all():
+        for worker, run in active_workers:
+            worker.cancel()
+
+    def end_run(run):
+        slot = run.pop("slot", None)
+        if slot:
+            threading.Thread(target=release_worktree_slot, args=(run["repo"], slot), daemon=True).start()
+
+    def poll_worker():
+        for worker, run in list(active_workers):
+            prefix = f"[{run['story']}] " if run is not None and run.get("slot") else ""
+            while True:
+                try:
+                    kind, cmd, payload = worker.events.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == "step":
+                    status_label.config(text=f"{prefix}Running: {cmd}")
+                    log_view.write(f"{prefix}$ {cmd}")
+                elif kind == "line":
+                    log_view.write(f"{prefix}{payload}")
+                elif kind == "progress":
+                    phase, pct = payload
+                    status_label.config(text=f"{prefix}Running: {cmd} - {phase} {pct}%")
+                elif kind == "failed":
+                    status_label.config(text="Error")
+                    messagebox.showerror("Git Error", payload)
+                elif kind == "cancelled":
+                    status_label.config(text="Cancelled")
+                elif kind == "done":
+                    on_done = cmd
+                    ok, results = payload
+                    active_workers[:] = [a for a in active_workers if a[0] is not worker]
+                    if not active_workers:
+                        btn_cancel.config(state=tk.DISABLED)
+                    enable_start()
+                    if ok and on_done is not None:
+                        on_done(results)
+                    if run is not None and not any(r is run for _, r in active_workers):
+                        end_run(run)
+                    break
+        root.after(100, poll_worker)
+
+    def show_output():
+        if not log_view.frame.winfo_ismapped():
+            log_view.frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+            current_width = root.winfo_width()
+            current_height = root.winfo_height()
+            root.geometry(f"{current_width}x{current_height + 300}")
 
     def clone_repo():
-        nonlocal repo_path
         url = simpledialog.askstring("Clone Repository", "Enter Git repository URL:", parent=root)
         if not url:
             messagebox.showinfo("Cancelled", "Clone cancelled")
@@ -272,6 +555,12 @@ def main():
         if not dest:
             messagebox.showinfo("Cancelled", "No destination selected")
             return
+        mode = show_clone_mode_dialog(root, config.get("clone_mode", "full"))
+        if mode is None:
+            messagebox.showinfo("Cancelled", "Clone cancelled")
+            return
+        config["clone_mode"] = mode
+        save_config(config)
         repo_name = find_repo_name_from_url(url)
         tgt_path = os.path.join(dest, repo_name)
         try:
@@ -280,56 +569,154 @@ def main():
             messagebox.showerror("Error", f"Failed to create directory:\n{e}")
             return
         status_label.config(text="Cloning repository...")
-        root.update()
-        success, out = run_cmd(f'git clone "{url}" "{tgt_path}"')
-        status_label.config(text="")
-        if success:
+        show_output()
+
+        use_mirror = config.get("mirror_cache", True)
+        mirror = mirror_path_for(url, cache_dir(config)) if use_mirror else None
+
+        def on_cloned(results):
+            nonlocal repo_path
+            if use_mirror:
+                # A full clone seeds a missing mirror, so the history is not
+                # downloaded twice; partial clones lack objects it needs.
+                start_mirror_update(url, cache_dir(config), tgt_path if mode == "full" else None)
+            status_label.config(text="")
             repo_path = tgt_path
             label_repo.config(text=f"Selected repo: {repo_path}")
+            if prefetcher:
+                prefetcher.watch(repo_path, fetch_now=False)
             enable_start()
             messagebox.showinfo("Success", "Repository cloned successfully")
-        else:
-            messagebox.showerror("Error", f"Git clone failed:\n{out}")
+        run_in_background(clone_steps(url, tgt_path, mode, mirror), on_cloned, trace=new_trace("clone", tgt_path))
+
+    def pick_repos(multiple=False):
+        index = config.get("repo_index", {})
+        depth = config.get("repo_scan_depth", REPO_SCAN_DEPTH)
+        if not index:
+            folder = filedialog.askdirectory(title="Select folder containing repositories", initialdir=repo_path or os.path.expanduser("~"))
+            if not folder:
+                messagebox.showinfo("Cancelled", "No folder selected")
+                return []
+            index = {os.path.abspath(folder): {}}
 
-    def select_repo():
-        nonlocal repo_path
-        folder = filedialog.askdirectory(title="Select folder containing repositories", initialdir=repo_path or os.path.expanduser("~"))
-        if not folder:
-            messagebox.showinfo("Cancelled", "No folder selected")
-            return
-        repos = [
-            os.path.join(folder, d)
-            for d in os.listdir(folder)
-            if os.path.isdir(os.path.join(folder, d, ".git"))
-        ]
-        if not repos:
-            messagebox.showwarning("No Repos", "No git repositories found")
-            return
         selected = []
-        def on_select(event):
-            sel = lb.curselection()
-            if sel:
-                selected.append(repos[sel[0]])
-                top.destroy()
+        shown = []
+        chosen = set()
+        results = queue.Queue()
+        scanning = []
+
         top = tk.Toplevel(root)
-        top.title("Select Repository")
-        tk.Label(top, text="Select repository:", font=("Arial", 12, "bold")).pack(
-            padx=10, pady=10
+        top.title("Select Repositories" if multiple else "Select Repository")
+        tk.Label(top, text="Select repositories:" if multiple else "Select repository:", font=("Arial", 12, "bold")).pack(
+            padx=10, pady=(10, 0)
         )
-        lb = tk.Listbox(top, width=80, height=15)
-        lb.pack(padx=10, pady=10)
-        for r in repos:
-            lb.insert(tk.END, r)
-        lb.bind("<<ListboxSelect>>", on_select)
+        filter_text = tk.StringVar()
+        ent_filter = tk.Entry(top, textvariable=filter_text, width=80)
+        ent_filter.pack(padx=10, pady=5)
+        lb = tk.Listbox(top, width=100, height=18, selectmode=tk.EXTENDED if multiple else tk.BROWSE, exportselection=False)
+        lb.pack(padx=10, pady=5)
+        label_status = tk.Label(top, text="", fg="gray")
+        label_status.pack(padx=10)
+        frame_buttons = tk.Frame(top)
+        frame_buttons.pack(pady=10)
+
+        def populate(*_):
+            shown[:] = filter_repos(indexed_repos(index), filter_text.get())
+            lb.delete(0, tk.END)
+            for path, info in shown:
+                details = "  ".join(v for v in (f"[{info['branch']}]" if info.get("branch") else "", info.get("remote", "")) if v)
+                lb.insert(tk.END, f"{path}  {details}" if details else path)
+                if path in chosen:
+                    lb.selection_set(tk.END)
+            if shown and not multiple:
+                lb.selection_set(0)
+            update_status()
+
+        def update_status():
+            total = len(indexed_repos(index))
+            status = f"{len(shown)} of {total} repositories"
+            if multiple:
+                status += f", {len(chosen)} selected"
+            label_status.config(text=f"{status} (scanning...)" if scanning else status)
+
+        def rescan():
+            if scanning:
+                return
+            scanning.append(True)
+            snapshot = dict(index)
+            threading.Thread(target=lambda: results.put(refresh_repo_index(snapshot, depth)), daemon=True).start()
+            if top.winfo_exists():
+                populate()
+            poll_scan()
+
+        def poll_scan():
+            try:
+                fresh = results.get_nowait()
+            except queue.Empty:
+                root.after(100, poll_scan)
+                return
+            scanning.clear()
+            index.update(fresh)
+            config["repo_index"] = index
+            save_config(config)
+            if any(not scan for scan in index.values()):
+                # A folder was added while the scan ran.
+                rescan()
+            elif top.winfo_exists():
+                populate()
+
+        def add_folder():
+            folder = filedialog.askdirectory(parent=top, title="Add folder containing repositories", initialdir=repo_path or os.path.expanduser("~"))
+            if folder and os.path.abspath(folder) not in index:
+                index[os.path.abspath(folder)] = {}
+                rescan()
+
+        def on_listbox_select(event):
+            if multiple:
+                sel = set(lb.curselection())
+                for i, (path, _) in enumerate(shown):
+                    if i in sel:
+                        chosen.add(path)
+                    else:
+                        chosen.discard(path)
+                update_status()
+
+        def on_select(event=None):
+            if multiple:
+                selected.extend(sorted(chosen))
+            else:
+                selected.extend(shown[i][0] for i in lb.curselection())
+            if selected:
+                top.destroy()
+
+        tk.Button(frame_buttons, text="Use selected" if multiple else "Open", command=on_select).pack(side=tk.LEFT, padx=5)
+        tk.Button(frame_buttons, text="Add folder...", command=add_folder).pack(side=tk.LEFT, padx=5)
+        tk.Button(frame_buttons, text="Rescan", command=rescan).pack(side=tk.LEFT, padx=5)
+        filter_text.trace_add("write", populate)
+        lb.bind("<<ListboxSelect>>", on_listbox_select)
+        if not multiple:
+            lb.bind("<Double-Button-1>", on_select)
+        lb.bind("<Return>", on_select)
+        ent_filter.bind("<Return>", on_select)
+        ent_filter.bind("<Down>", lambda e: lb.focus_set())
+        ent_filter.focus_set()
+        populate()
+        rescan()
         top.grab_set()
         root.wait_window(top)
+        return selected
+
+    def select_repo():
+        nonlocal repo_path
+        selected = pick_repos()
         if selected:
             repo_path = selected[0]
             label_repo.config(text=f"Selected repo: {repo_path}")
+            if prefetcher:
+                prefetcher.watch(repo_path)
             enable_start()
 
     def start_automation():
-        nonlocal repo_path
         if not repo_path:
             messagebox.showerror("Error", "Please select or clone a repository first")
             return
@@ -339,36 +726,192 @@ def main():
         if not story or not branch or not commit_headline:
             messagebox.showerror("Error", "Please fill all required fields")
             return
-        full_branch = branch if "_" in branch else f"{story}_{branch}"
+        full_branch = story_branch_name(story, branch)
+        # Everything the later stages need is captured here, so selecting
+        # another repo or starting another story mid-run can't mix them up.
+        run = {
+            "repo": repo_path, "workdir": repo_path, "slot": None, "story": story,
+            "full_branch": full_branch, "commit_headline": commit_headline, "mode": workflow_mode.get(),
+            "trace": new_trace("story", repo_path, story),
+        }
 
-        if not output_text.winfo_ismapped():
-            output_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
-            current_width = root.winfo_width()
-            current_height = root.winfo_height()
-            root.geometry(f"{current_width}x{current_height + 300}")
+        show_output()
 
         status_label.config(text="Running git commands...")
-        root.update()
-        run_cmd(f'git config user.name "{git_name}"', cwd=repo_path)
-        run_cmd(f'git config user.email "{git_email}"', cwd=repo_path)
-        cmds = [
-            ("git fetch origin", repo_path),
-            ("git checkout dev", repo_path),
-            ("git reset --hard origin/dev", repo_path),
-            (f'git checkout -b "{full_branch}"', repo_path),
-        ]
-        for cmd, cwd in cmds:
-            status_label.config(text=f"Running: {cmd}")
-            root.update()
-            success, out = run_cmd(cmd, cwd=cwd)
-            output_text.insert(tk.END, f"$ {cmd}\n{out}\n")
-            output_text.see(tk.END)
-            if not success:
-                messagebox.showerror("Git Error", f"Command failed:\n{cmd}\n{out}")
-                status_label.config(text="Error")
+        fetch = not (prefetcher and prefetcher.is_fresh(repo_path, prefetch_max_age))
+        if not fetch:
+            age = describe_age(prefetcher.age(repo_path))
+            log_view.write(f"origin/dev was fetched {age}; skipping fetch")
+        if use_worktree.get():
+            try:
+                slot = acquire_worktree_slot(repo_path, cache_dir(config))
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to prepare worktree:\n{e}")
+                return
+            run["slot"] = run["workdir"] = slot
+            steps = [dev_fetch_step(repo_path)] if fetch else []
+            steps += worktree_branch_steps(repo_path, slot, full_branch)
+        else:
+            steps = prepare_branch_steps(repo_path, full_branch, fetch)
+
+        def on_branch_ready(results):
+            if fetch and prefetcher:
+                prefetcher.mark_fresh(run["repo"])
+            collect_files(run)
+        run_in_background(steps, on_branch_ready, run)
+
+    def pick_changeset_ids(run, changelog_path, up_rels, then):
+        # The first lookup may build the changelog index, so it runs on a
+        # worker; then gets the ids, or None if the update should be skipped.
+        def resolve():
+            return resolve_changeset_ids(
+                changelog_family(changelog_path, config.get("changelog_shard", "off")),
+                default_changeset_id(run["story"]), username, up_rels,
+                config.get("duplicate_changesets", "suffix"),
+            )
+
+        def on_resolved(outcome):
+            import xml.etree.ElementTree as ET
+            if isinstance(outcome, DuplicateChangeSetError):
+                messagebox.showerror("Duplicate changeSet", str(outcome))
+            elif isinstance(outcome, ET.ParseError):
+                messagebox.showerror("Invalid changelog", f"Changelog is not well-formed XML:\n{outcome}")
+            elif isinstance(outcome, Exception):
+                messagebox.showerror("Error", f"Failed to read changelog file:\n{outcome}")
+            else:
+                changeset_ids, conflicts = outcome
+                if not conflicts or messagebox.askyesno(
+                    "Duplicate sqlFile",
+                    f"{describe_sql_conflicts(conflicts)}\n\nAdd another changeSet for it anyway?",
+                ):
+                    then(changeset_ids)
+                    return
+            then(None)
+        call_in_background(resolve, on_resolved, run, "Checking changelog...")
+
+    def ask_migration_pairs():
+        files = filedialog.askopenfilenames(title="Select UP and DOWN migration files (paired by name: X_up.sql / X_down.sql)")
+        if not files:
+            messagebox.showerror("Error", "UP migration file required.")
+            return None
+        if len(files) == 1:
+            down_file_path = filedialog.askopenfilename(title="Select DOWN migration file")
+            if not down_file_path:
+                messagebox.showerror("Error", "DOWN migration file required.")
+                return None
+            return [(files[0], down_file_path)]
+        pairs, unmatched = pair_migration_files(files)
+        if not pairs:
+            messagebox.showerror("Error", "No UP/DOWN pairs found; name them like X_up.sql and X_down.sql.")
+            return None
+        if unmatched and not messagebox.askyesno(
+            "Unmatched files",
+            "These files have no UP/DOWN partner and will be skipped:\n\n"
+            + "\n".join(os.path.basename(path) for path in unmatched)
+            + f"\n\nContinue with {len(pairs)} pair(s)?",
+        ):
+            return None
+        return pairs
+
+    def ask_object_types(pairs):
+        if len(pairs) == 1:
+            obj_type = show_db_object_type_dialog(root)
+            return None if obj_type is None else [obj_type]
+        return show_object_types_dialog(root, [os.path.basename(up) for up, _ in pairs])
+
+    def pick_shard_target(changelog_path):
+        try:
+            return shard_target(
+                changelog_path, config.get("changelog_shard", "off"),
+                config.get("changelog_shard_max_bytes", DEFAULT_SHARD_MAX_BYTES),
+            )
+        except InvalidChangelogError as e:
+            messagebox.showerror("Invalid changelog", str(e))
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to create changelog shard:\n{e}")
+        return None
+
+    def preflight(run, then, pairs=(), ge_files=()):
+        # Calls then() unless preflight finds errors and the user stops.
+        # Errors need an explicit go-ahead; warnings only go to the log.
+        if not config.get("preflight", True):
+            then()
+            return
+
+        def check():
+            with trace_span(run["trace"], "preflight", files=2 * len(pairs) + len(ge_files)) as span:
+                issues, span["cached"] = run_preflight(pairs, ge_files, cache_dir(config))
+                return issues, preflight_totals(span, issues)
+
+        def on_checked(outcome):
+            if isinstance(outcome, Exception):
+                messagebox.showerror("Preflight Error", f"Could not check the selected files:\n{outcome}")
                 return
+            issues, errors = outcome
+            if issues:
+                report = describe_preflight(issues)
+                log_view.write(report)
+                if errors and not messagebox.askyesno(
+                    "Preflight failed", f"{report}\n\nContinue anyway?", icon="warning",
+                ):
+                    return
+            then()
+        call_in_background(check, on_checked, run, "Checking files...")
+
+    def update_changelog(changelog_path, changelog_entry, trace):
+        try:
+            append_to_changelog(changelog_path, changelog_entry, trace)
+            return True
+        except InvalidChangelogError as e:
+            messagebox.showerror("Invalid changelog", str(e))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to update changelog file:\n{e}")
+        return False
+
+    def copy_into_repo(run, copies, then):
+        # Hashing and copying run on workers; then gets the destination
+        # paths unless the copy failed or the user declined to overwrite
+        # differing files. The question is asked between the spans, so the
+        # user's thinking time is not recorded as copy time.
+        def plan():
+            with trace_span(run["trace"], "copy plan", files=len(copies)) as span:
+                items = plan_copies(copies)
+                span["differing"] = sum(item["action"] == "overwrite" for item in items)
+                return items
 
-        if workflow_mode.get() == "GE Scripts":
+        def execute(items):
+            with trace_span(run["trace"], "copy", files=len(copies)) as span:
+                return execute_copies(items, span)
+
+        def on_copied(outcome):
+            if isinstance(outcome, Exception):
+                messagebox.showerror("File Copy Error", f"Failed to copy files:\n{outcome}")
+            else:
+                then(outcome)
+
+        def on_planned(outcome):
+            if isinstance(outcome, Exception):
+                on_copied(outcome)
+                return
+            differing = [item for item in outcome if item["action"] == "overwrite"]
+            if differing and not messagebox.askyesno(
+                "Files differ",
+                "These files already exist in the repository with different content:\n\n"
+                + describe_differing(differing) + "\n\nOverwrite them?",
+            ):
+                return
+            call_in_background(lambda: execute(outcome), on_copied, run, "Copying files...")
+        call_in_background(plan, on_planned, run, "Checking files...")
+
+    def collect_files(run):
+        # A chain of dialogs; the slow checks and copies in between run on
+        # workers, each handing on to the next stage when it is done.
+        repo_path = run["repo"]
+
+        def inside_repo(folder):
+            return is_inside(folder, repo_path) or is_inside(folder, run["workdir"])
+
+        if run["mode"] == "GE Scripts":
             checkpoint_file = filedialog.askopenfilename(title="Select Checkpoint file")
             if not checkpoint_file:
                 messagebox.showerror("Error", "Checkpoint file is required.")
@@ -395,149 +938,249 @@ def main():
                     "Error", "Target folder for Expectation file is required."
                 )
                 return
-            repo_abs = os.path.abspath(repo_path)
             for folder, name in [(checkpoint_target, "Checkpoint"), (expectation_target, "Expectation")]:
-                folder_abs = os.path.abspath(folder)
-                if not folder_abs.startswith(repo_abs):
+                if not inside_repo(folder):
                     messagebox.showerror(
                         "Invalid folder",
                         f"{name} target folder must be inside repository.",
                     )
                     return
-            try:
-                shutil.copy(checkpoint_file, checkpoint_target)
-                shutil.copy(expectation_file, expectation_target)
-            except Exception as e:
-                messagebox.showerror("File Copy Error", f"Failed to copy files:\n{e}")
-                return
-            up_file = os.path.basename(checkpoint_file)
-            down_file = os.path.basename(expectation_file)
-            target_folders = {"up": checkpoint_target, "down": expectation_target}
+
+            def copy_ge_files():
+                copy_into_repo(run, [
+                    (checkpoint_file, map_to_workdir(checkpoint_target, repo_path, run["workdir"])),
+                    (expectation_file, map_to_workdir(expectation_target, repo_path, run["workdir"])),
+                ], lambda dests: stage_files(run, [tuple(dests)]))
+            preflight(run, copy_ge_files, ge_files=[(checkpoint_file, "checkpoint"), (expectation_file, "expectation")])
         else:
-            up_file_path = filedialog.askopenfilename(title="Select UP migration file")
-            if not up_file_path:
-                messagebox.showerror("Error", "UP migration file required.")
-                return
-            down_file_path = filedialog.askopenfilename(title="Select DOWN migration file")
-            if not down_file_path:
-                messagebox.showerror("Error", "DOWN migration file required.")
+            pairs = ask_migration_pairs()
+            if not pairs:
                 return
-            while True:
-                target_folder = filedialog.askdirectory(
-                    title="Select target folder INSIDE repository",
-                    initialdir=repo_path if repo_path else None
-                )
-                if not target_folder:
-                    messagebox.showerror("Error", "Target folder inside repo is required.")
-                    return
-                repo_abs = os.path.abspath(repo_path)
-                tgt_abs = os.path.abspath(target_folder)
-                if not tgt_abs.startswith(repo_abs):
-                    messagebox.showerror("Error", "Target folder must be inside repository.")
-                else:
-                    break
-            try:
-                shutil.copy(up_file_path, target_folder)
-                shutil.copy(down_file_path, target_folder)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to copy files:\n{e}")
-                return
-            up_file = os.path.basename(up_file_path)
-            down_file = os.path.basename(down_file_path)
-            target_folders = {"up": target_folder, "down": target_folder}
 
-        changelog_file_to_add = None
-        if workflow_mode.get() == "DB Objects":
-            obj_type = show_db_object_type_dialog(root)
-            if obj_type is None:
-                messagebox.showinfo("Skipped", "Changelog update skipped (no DB Object Type selected)")
-            else:
-                changelog_path = filedialog.askopenfilename(
-                    title="Select changelog.xml file",
-                    filetypes=[("XML files", "*.xml"), ("All files", "*.*")],
-                    initialdir=repo_path if repo_path else None
-                )
-                if not changelog_path:
-                    messagebox.showinfo("Skipped", "No changelog selected; skipping update")
-                else:
-                    changelog_dir = os.path.dirname(os.path.abspath(changelog_path))
-                    if obj_type == "Table":
-                        up_rel = os.path.relpath(os.path.join(target_folders["up"], up_file), changelog_dir)
-                        down_rel = os.path.relpath(os.path.join(target_folders["down"], down_file), changelog_dir)
+            def copy_migrations():
+                while True:
+                    target_folder = filedialog.askdirectory(
+                        title="Select target folder INSIDE repository",
+                        initialdir=repo_path if repo_path else None
+                    )
+                    if not target_folder:
+                        messagebox.showerror("Error", "Target folder inside repo is required.")
+                        return
+                    if not inside_repo(target_folder):
+                        messagebox.showerror("Error", "Target folder must be inside repository.")
                     else:
-                        up_rel = up_file
-                        down_rel = down_file
-                    changelog_entry = generate_changelog_entry(username, story, up_rel, down_rel, obj_type)
-                    if append_to_changelog(changelog_path, changelog_entry):
-                        messagebox.showinfo("Success", "Changelog updated successfully")
-                        open_file_in_editor(changelog_path)
-                        changelog_file_to_add = changelog_path
-
-        files_to_add = [
-            os.path.join(target_folders["up"], up_file),
-            os.path.join(target_folders["down"], down_file),
+                        break
+                target_folder = map_to_workdir(target_folder, repo_path, run["workdir"])
+                copy_into_repo(
+                    run, [(path, target_folder) for pair in pairs for path in pair],
+                    lambda dests: add_changelog_entries(run, list(zip(dests[::2], dests[1::2]))),
+                )
+            preflight(run, copy_migrations, pairs)
+
+    def add_changelog_entries(run, copied):
+        repo_path = run["repo"]
+        story = run["story"]
+        obj_types = ask_object_types(copied)
+        if obj_types is None:
+            messagebox.showinfo("Skipped", "Changelog update skipped (no DB Object Type selected)")
+            stage_files(run, copied)
+            return
+        changelog_path = filedialog.askopenfilename(
+            title="Select changelog.xml file",
+            filetypes=[("XML files", "*.xml"), ("All files", "*.*")],
+            initialdir=repo_path if repo_path else None
+        )
+        if not changelog_path:
+            messagebox.showinfo("Skipped", "No changelog selected; skipping update")
+            stage_files(run, copied)
+            return
+        changelog_path = map_to_workdir(changelog_path, repo_path, run["workdir"])
+        sql_paths = [
+            changelog_sql_paths(obj_type, up, down, changelog_path)
+            for obj_type, (up, down) in zip(obj_types, copied)
         ]
-        if workflow_mode.get() == "DB Objects" and changelog_file_to_add:
-            files_to_add.append(changelog_file_to_add)
 
-        for file_path in files_to_add:
-            try:
-                rel_path = os.path.relpath(file_path, repo_path)
-            except Exception:
-                rel_path = file_path
-            cmd_add = f'git add "{rel_path}"'
-            status_label.config(text=f"Adding {rel_path}")
-            root.update()
-            success, out = run_cmd(cmd_add, cwd=repo_path)
-            output_text.insert(tk.END, f"$ {cmd_add}\n{out}\n")
-            output_text.see(tk.END)
-            if not success:
-                messagebox.showerror("Error", f"Failed to add {rel_path}")
-                return
+        def on_ids(changeset_ids):
+            changelog_files_to_add = []
+            target = pick_shard_target(changelog_path) if changeset_ids is not None else None
+            if target is None:
+                messagebox.showinfo("Skipped", "Changelog update skipped")
+            elif update_changelog(
+                target[0],
+                "\n".join(
+                    generate_changelog_entry(username, story, up_rel, down_rel, obj_type, changeset_id)
+                    for obj_type, (up_rel, down_rel), changeset_id in zip(obj_types, sql_paths, changeset_ids)
+                ),
+                run["trace"],
+            ):
+                messagebox.showinfo("Success", "Changelog updated successfully")
+                open_file_in_editor(target[0])
+                changelog_files_to_add.append(target[0])
+            if target is not None and target[1]:
+                changelog_files_to_add.append(changelog_path)
+            stage_files(run, copied, changelog_files_to_add)
+        pick_changeset_ids(run, changelog_path, [up_rel for up_rel, _ in sql_paths], on_ids)
+
+    def stage_files(run, copied, extra=()):
+        files_to_add = [path for pair in copied for path in pair] + list(extra)
+        steps = [
+            git_add_step(run["workdir"], files_to_add),
+            status_step(run["workdir"], files_to_add, **status_options(config)),
+        ]
+        run_in_background(steps, lambda results: confirm_commit(results, run), run)
 
-        modified_files = git_get_modified_files(repo_path)
-        if not modified_files:
+    def confirm_commit(results, run):
+        changes = parse_status_v2(results[-1][2])
+        if not any(change["staged"] for change in changes):
             messagebox.showinfo("No changes", "No modified/new files to commit.")
             return
-        file_list_text = "\n".join(modified_files)
         if not messagebox.askyesno(
             "Confirm Commit",
-            f"The following files are staged for commit:\n\n{file_list_text}\n\nProceed?",
+            f"{describe_changes(changes)}\n\nProceed?",
         ):
             messagebox.showinfo("Cancelled", "Commit operation cancelled")
             return
 
-        commit_msg = f"AB#{story}: {commit_headline}"
-        status_label.config(text="Committing changes...")
-        root.update()
-        success, out = run_cmd(f'git commit -m "{commit_msg}"', cwd=repo_path)
-        output_text.insert(tk.END, f'$ git commit -m "{commit_msg}"\n{out}\n')
-        output_text.see(tk.END)
-        if not success:
-            messagebox.showerror("Commit failed", "Commit failed or no changes to commit.")
-            return
-
-        status_label.config(text=f"Pushing branch {full_branch}...")
-        root.update()
-        success, out = run_cmd(f'git push origin "{full_branch}"', cwd=repo_path)
-        output_text.insert(tk.END, f'$ git push origin "{full_branch}"\n{out}\n')
-        output_text.see(tk.END)
-        if not success:
-            messagebox.showerror("Push failed", "Failed to push branch.")
-            return
+        steps = commit_push_steps(
+            run["workdir"], run["full_branch"], commit_message(run["story"], run["commit_headline"]),
+            git_name, git_email,
+        )
+        run_in_background(steps, lambda results: finish_automation(run, results), run)
 
-        pr_link = get_github_pr_url(repo_path, full_branch)
-        if pr_link:
+    def finish_automation(run, results):
+        pr_link = get_github_pr_url(run["repo"], run["full_branch"])
+        stats = spawn_stats(run["trace"])
+        log_view.write(f"[stats] {stats['count']} git processes, {stats['seconds']:.2f}s spent in subprocesses")
+        if not results[-1][1]:
+            # Worktrees share the repo's branches, so the queue pushes from
+            # the repo itself and survives the slot being released.
+            pushes.add(run["repo"], run["full_branch"], results[-1][2])
+            status_label.config(text="Committed; push failed and is queued for retry.")
+            messagebox.showwarning(
+                "Push queued",
+                f"The commit was made, but pushing {run['full_branch']} failed. "
+                "It will be retried in the background, also after a restart.",
+            )
+            label_pushes.config(text=f"{len(pushes.pending())} push(es) queued for retry")
+        elif pr_link:
             status_label.config(text="Automation complete. Pull request link below.")
             show_pr_popup(root, pr_link)
         else:
             status_label.config(text="Automation complete.")
 
+    def start_fan_out():
+        story = ent_story.get().strip()
+        branch = ent_branch.get().strip()
+        commit_headline = ent_commit.get().strip()
+        if not story or not branch or not commit_headline:
+            messagebox.showerror("Error", "Please fill all required fields")
+            return
+        repos = pick_repos(multiple=True)
+        if not repos:
+            return
+        # Folders and the changelog are picked inside the first repository
+        # and applied to every repository as the same relative path.
+        first = repos[0]
+        mode = workflow_mode.get()
+        raw = {"story_id": story, "branch": branch, "commit_headline": commit_headline, "mode": mode}
+        if mode == "GE Scripts":
+            files = [("checkpoint_file", "Checkpoint file"), ("expectation_file", "Expectation file")]
+            folders = [("checkpoint_target", "Checkpoint file"), ("expectation_target", "Expectation file")]
+        else:
+            pairs = ask_migration_pairs()
+            if not pairs:
+                return
+            raw["migrations"] = [{"up_file": up, "down_file": down} for up, down in pairs]
+            files = []
+            folders = [("target_folder", "migration files")]
+        for key, name in files:
+            path = filedialog.askopenfilename(title=f"Select {name}")
+            if not path:
+                messagebox.showerror("Error", f"{name} is required.")
+                return
+            raw[key] = path
+        for key, name in folders:
+            while True:
+                folder = filedialog.askdirectory(
+                    title=f"Select target folder for {name} in {os.path.basename(first)} (used for every repo)",
+                    initialdir=first,
+                )
+                if not folder:
+                    messagebox.showerror("Error", f"Target folder for {name} is required.")
+                    return
+                if is_inside(folder, first):
+                    break
+                messagebox.showerror("Error", f"Target folder must be inside {first}.")
+            raw[key] = os.path.relpath(folder, first)
+        if mode == "DB Objects":
+            obj_types = ask_object_types(pairs)
+            if obj_types is None:
+                messagebox.showinfo("Skipped", "Changelog update skipped (no DB Object Type selected)")
+            else:
+                changelog_path = filedialog.askopenfilename(
+                    title=f"Select changelog.xml file in {os.path.basename(first)} (used for every repo)",
+                    filetypes=[("XML files", "*.xml"), ("All files", "*.*")],
+                    initialdir=first,
+                )
+                if not changelog_path:
+                    messagebox.showinfo("Skipped", "No changelog selected; skipping update")
+                elif not is_inside(changelog_path, first):
+                    messagebox.showerror("Error", f"Changelog must be inside {first}.")
+                    return
+                else:
+                    for migration, obj_type in zip(raw["migrations"], obj_types):
+                        migration["object_type"] = obj_type
+                    raw["changelog"] = os.path.relpath(changelog_path, first)
+        try:
+            entries = [normalize_manifest_entry(dict(raw, repo=repo), first, n) for n, repo in enumerate(repos, 1)]
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
+        settings = dict(story_settings(config), username=username, git_name=git_name, git_email=git_email)
+        settings["worktrees"] = use_worktree.get()
+        workers = config.get("fan_out_workers", config.get("max_workers", 4))
+        lines = queue.Queue()
+        done = queue.Queue()
+        fan_outs.append(story)
+        enable_start()
+        show_output()
+        status_label.config(text=f"Fan-out: {story} in {len(entries)} repositories...")
+        threading.Thread(target=lambda: done.put(run_manifest(entries, settings, workers, lines.put)), daemon=True).start()
+
+        def drain():
+            while True:
+                try:
+                    log_view.write(lines.get_nowait())
+                except queue.Empty:
+                    break
+
+        def poll_fan_out():
+            drain()
+            try:
+                results = done.get_nowait()
+            except queue.Empty:
+                root.after(100, poll_fan_out)
+                return
+            drain()
+            fan_outs.remove(story)
+            enable_start()
+            ok = sum(1 for r in results if r["status"] == "ok")
+            status_label.config(text=f"Fan-out complete: {ok} of {len(results)} repositories succeeded.")
+            log_view.write(format_results_table(results))
+            show_fan_out_results(root, results)
+        poll_fan_out()
+
     btn_clone.config(command=clone_repo)
     btn_select.config(command=select_repo)
     btn_start.config(command=start_automation)
+    btn_fan_out.config(command=start_fan_out)
+    btn_cancel.config(command=cancel_all)
     enable_start()
+    poll_worker()
+    update_freshness()
+    update_push_status()
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(cli_main(gui=main))
@@ -0,0 +1,2584 @@
+import os
+import subprocess
+import shutil
+import threading
+import queue
+import signal
+import collections
+import contextlib
+import shlex
+import time
+import datetime
+import json
+import sys
+import hashlib
+import itertools
+import atexit
+import re
+# csv, argparse, concurrent.futures, uuid, sqlite3 and xml.etree are
+# imported by the functions that need them (manifests, the CLI, worker
+# pools, tracing, the changelog index), so importing the core stays cheap.
+
+# Everything here runs without a display: the GUI in git_automation_app.py
+# and headless runs (--manifest, benchmarks) share it, and nothing imports
+# tkinter. Failures are raised as exceptions or returned in result dicts.
+
+CONFIG_FILE = "config.json"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".git_automation")
+
+def load_config():
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, "r") as f:
+            return json.load(f)
+    return {}
+
+def save_config(data):
+    with open(CONFIG_FILE, "w") as f:
+        json.dump(data, f)
+
+def cache_dir(config):
+    return config.get("cache_dir") or DEFAULT_CACHE_DIR
+
+MAX_OUTPUT_LINES = 2000
+MAX_LINE_CHARS = 4000
+PROGRESS_RE = re.compile(r"^(?:remote: )?([A-Za-z][A-Za-z ]*?):\s+(\d+)%")
+LINE_END_RE = re.compile(rb"\r\n|[\r\n]")
+
+def parse_git_progress(line):
+    m = PROGRESS_RE.match(line)
+    if m:
+        return m.group(1), int(m.group(2))
+    return None
+
+def spawn_stats(trace):
+    # Processes run_steps started for this run only; background fetches,
+    # push retries and other runs count against their own traces.
+    return dict(trace["spawns"]) if trace else {"count": 0, "seconds": 0.0}
+
+TRACE_MAX_BYTES = 5 * 1024 * 1024
+TRACE_BACKUPS = 3
+TRACE_SETTINGS = {"path": None, "max_bytes": TRACE_MAX_BYTES, "backups": TRACE_BACKUPS}
+TRACE_EXPORTERS = []
+_trace_lock = threading.Lock()
+
+def configure_tracing(config):
+    # Step timings go to <cache_dir>/trace.jsonl unless config has
+    # "trace": false. trace_otlp_endpoint additionally ships every record to
+    # an OpenTelemetry collector (e.g. http://localhost:4318/v1/traces).
+    if config.get("trace", True):
+        path = config.get("trace_file") or os.path.join(cache_dir(config), "trace.jsonl")
+    else:
+        path = None
+    TRACE_SETTINGS.update(
+        path=path,
+        max_bytes=config.get("trace_max_bytes", TRACE_MAX_BYTES),
+        backups=config.get("trace_backups", TRACE_BACKUPS),
+    )
+    TRACE_EXPORTERS[:] = [OtlpExporter(config["trace_otlp_endpoint"])] if config.get("trace_otlp_endpoint") else []
+
+def new_trace(kind, repo, story=None):
+    # Identifies one run (a story, a clone); every step recorded against it
+    # shares the run_id.
+    import uuid
+    return {
+        "run_id": uuid.uuid4().hex, "kind": kind, "repo": repo, "story": story,
+        "spawns": {"count": 0, "seconds": 0.0},
+    }
+
+def git_command_name(args):
+    # "git -c x=y fetch origin" -> "git fetch"
+    if isinstance(args, str):
+        args = args.split()
+    if not args or os.path.basename(args[0]) != "git":
+        return os.path.basename(args[0]) if args else ""
+    rest = iter(args[1:])
+    for arg in rest:
+        if arg in ("-c", "-C", "--git-dir", "--work-tree"):
+            next(rest, None)
+        elif not arg.startswith("-"):
+            return f"git {arg}"
+    return "git"
+
+def repo_size_bytes(repo):
+    # Object database size (packs plus loose objects), which is what
+    # fetch/push/clone time scales with. Measured once per run.
+    git_dir = common_git_dir(repo) if repo else None
+    if not git_dir or not os.path.isdir(os.path.join(git_dir, "objects")):
+        return None
+    total = 0
+    stack = [os.path.join(git_dir, "objects")]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            pass
+    return total
+
+def record_trace(trace, step, seconds, ok, exit_code=None, output_bytes=None, cmd=None, **extra):
+    if trace is None or not (TRACE_SETTINGS["path"] or TRACE_EXPORTERS):
+        return
+    if "repo_size_bytes" not in trace:
+        size = repo_size_bytes(trace["repo"])
+        if size is not None:
+            trace["repo_size_bytes"] = size
+    now = time.time()
+    record = {
+        "ts": datetime.datetime.fromtimestamp(now).isoformat(timespec="milliseconds"),
+        "start": round(now - seconds, 6),
+        "run_id": trace["run_id"], "kind": trace["kind"], "story": trace["story"], "repo": trace["repo"],
+        "step": step, "cmd": cmd, "seconds": round(seconds, 6), "ok": ok,
+        "exit_code": exit_code, "output_bytes": output_bytes, "repo_size_bytes": trace.get("repo_size_bytes"),
+    }
+    record.update(extra)
+    if TRACE_SETTINGS["path"]:
+        try:
+            write_trace_line(TRACE_SETTINGS["path"], json.dumps(record))
+        except OSError:
+            pass
+    for exporter in TRACE_EXPORTERS:
+        exporter.export(record)
+
+def write_trace_line(path, line):
+    data = (line + "\n").encode("utf-8")
+    with _trace_lock:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if size and size + len(data) > TRACE_SETTINGS["max_bytes"]:
+            backups = TRACE_SETTINGS["backups"]
+            for n in range(backups - 1, 0, -1):
+                if os.path.exists(f"{path}.{n}"):
+                    os.replace(f"{path}.{n}", f"{path}.{n + 1}")
+            if backups > 0:
+                os.replace(path, f"{path}.1")
+            else:
+                os.remove(path)
+        with open(path, "ab") as f:
+            f.write(data)
+
+@contextlib.contextmanager
+def trace_span(trace, step, **extra):
+    # Times a non-git step; the body may add fields to the yielded dict.
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield extra
+        ok = True
+    finally:
+        record_trace(trace, step, time.perf_counter() - started, ok, **extra)
+
+class OtlpExporter:
+    # Sends trace records as OTLP/HTTP JSON spans from a background thread,
+    # so a slow or absent collector never delays a git step.
+    def __init__(self, endpoint, batch_size=50):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=10000)
+        threading.Thread(target=self._loop, daemon=True).start()
+        atexit.register(self.flush)
+
+    def export(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+    def flush(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _loop(self):
+        import urllib.request  # pulls in http.client and ssl; only needed once exporting
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=0.5))
+                except queue.Empty:
+                    break
+            body = json.dumps(otlp_payload(batch)).encode("utf-8")
+            request = urllib.request.Request(
+                self.endpoint, data=body, headers={"Content-Type": "application/json"}, method="POST"
+            )
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except Exception:
+                pass
+            for _ in batch:
+                self.queue.task_done()
+
+def otlp_payload(records):
+    spans = []
+    for record in records:
+        attributes = [
+            {"key": f"git_automation.{key}", "value": {"stringValue": json.dumps(value) if isinstance(value, (list, dict)) else str(value)}}
+            for key, value in record.items()
+            if key not in ("ts", "start", "seconds", "run_id", "step") and value is not None
+        ]
+        start_ns = int(record["start"] * 1e9)
+        spans.append({
+            "traceId": record["run_id"][:32].rjust(32, "0"),
+            "spanId": os.urandom(8).hex(),
+            "name": record["step"],
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(record["seconds"] * 1e9)),
+            "attributes": attributes,
+            "status": {"code": 1 if record["ok"] else 2},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "git-automation-app"}}]},
+        "scopeSpans": [{"scope": {"name": "git_automation_app"}, "spans": spans}],
+    }]}
+
+def trace_files(path):
+    # Oldest first, so records come out in time order.
+    rotated = sorted(
+        (p for p in (f"{path}.{n}" for n in range(1, 100)) if os.path.exists(p)),
+        key=lambda p: int(p.rsplit(".", 1)[1]), reverse=True,
+    )
+    return rotated + ([path] if os.path.exists(path) else [])
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile of an already sorted list.
+    rank = -(-pct * len(sorted_values) // 100)
+    return sorted_values[max(1, int(rank)) - 1]
+
+def summarize_traces(paths, since=None):
+    # Returns rows of (step, count, failures, p50, p95, max) in seconds,
+    # slowest p95 first.
+    timings = collections.defaultdict(list)
+    failures = collections.Counter()
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if since is not None and record.get("start", 0) < since:
+                    continue
+                timings[record["step"]].append(record["seconds"])
+                if not record.get("ok"):
+                    failures[record["step"]] += 1
+    rows = []
+    for step, values in timings.items():
+        values.sort()
+        rows.append((step, len(values), failures[step], percentile(values, 50), percentile(values, 95), values[-1]))
+    rows.sort(key=lambda row: row[4], reverse=True)
+    return rows
+
+def format_trace_summary(rows):
+    lines = [f"{'step':<28} {'count':>7} {'failed':>7} {'p50 s':>9} {'p95 s':>9} {'max s':>9}"]
+    for step, count, failed, p50, p95, worst in rows:
+        lines.append(f"{step:<28} {count:>7} {failed:>7} {p50:>9.3f} {p95:>9.3f} {worst:>9.3f}")
+    return "\n".join(lines)
+
+def format_cmd(args):
+    if isinstance(args, str):
+        return args
+    return " ".join(shlex.quote(a) for a in args)
+
+def git_identity_env(name, email):
+    # Author/committer identity for a single invocation, so nothing is
+    # written to the repository's config.
+    env = dict(os.environ)
+    env["GIT_AUTHOR_NAME"] = env["GIT_COMMITTER_NAME"] = name
+    env["GIT_AUTHOR_EMAIL"] = env["GIT_COMMITTER_EMAIL"] = email
+    return env
+
+def git_step(args, cwd, failure=None, env=None, input_data=None, lock=None):
+    return {"args": args, "cwd": cwd, "failure": failure, "env": env, "input": input_data, "lock": lock}
+
+def git_add_step(repo_path, paths, failure=None):
+    # One `git add` for any number of files; paths go in NUL-separated on
+    # stdin so quoting and command-line length limits don't matter.
+    rel_paths = []
+    for file_path in paths:
+        try:
+            rel_paths.append(os.path.relpath(file_path, repo_path))
+        except ValueError:
+            rel_paths.append(file_path)
+    data = b"".join(p.encode("utf-8") + b"\0" for p in rel_paths)
+    return git_step(
+        ["git", "add", "--pathspec-from-file=-", "--pathspec-file-nul"], repo_path,
+        failure=failure or "Failed to add:\n" + "\n".join(rel_paths), input_data=data,
+    )
+
+def stream_cmd(cmd, cwd=None, on_line=None, on_progress=None, cancel_event=None,
+               max_lines=MAX_OUTPUT_LINES, env=None, input_data=None, stats=None, raw=False):
+    # Popen-based runner: stdout and stderr are merged and split on \n, \r\n
+    # and \r so git's --progress updates arrive as they are printed. Only the
+    # last max_lines lines are kept; progress redraws are never stored.
+    # raw returns the output whole instead, for machine-readable (-z) output.
+    # stats, if given, receives the exit code and total output bytes.
+    tail = [] if raw else collections.deque(maxlen=max_lines)
+    output_bytes = 0
+    started = time.perf_counter()
+    try:
+        proc = subprocess.Popen(
+            cmd, cwd=cwd, shell=isinstance(cmd, str), env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+            bufsize=0, start_new_session=(os.name == "posix"),
+        )
+    except Exception as e:
+        return False, str(e)
+    if input_data is not None:
+        def feed():
+            try:
+                proc.stdin.write(input_data)
+                proc.stdin.close()
+            except OSError:
+                pass
+        threading.Thread(target=feed, daemon=True).start()
+    if cancel_event is not None:
+        def watch():
+            while proc.poll() is None:
+                if cancel_event.wait(0.2):
+                    kill_process(proc)
+                    return
+        threading.Thread(target=watch, daemon=True).start()
+
+    last_progress = None
+    def emit_line(data, sep):
+        # A bare \r ends a progress redraw, which is not kept as output;
+        # \n and \r\n (hooks, Windows tools) end real lines.
+        nonlocal last_progress
+        line = data.decode("utf-8", errors="replace")[:MAX_LINE_CHARS]
+        progress = parse_git_progress(line)
+        if progress and progress != last_progress:
+            last_progress = progress
+            if on_progress:
+                on_progress(*progress)
+        if sep == b"\r" or not line:
+            return
+        tail.append(line)
+        if on_line:
+            on_line(line)
+    pending = b""
+    while True:
+        chunk = proc.stdout.read(8192)
+        if not chunk:
+            break
+        output_bytes += len(chunk)
+        if raw:
+            tail.append(chunk)
+            continue
+        pending += chunk
+        while True:
+            m = LINE_END_RE.search(pending)
+            # A \r at the end of the buffer may be the first half of a \r\n.
+            if not m or m.group() == b"\r" and m.end() == len(pending):
+                break
+            emit_line(pending[:m.start()], m.group())
+            pending = pending[m.end():]
+    if pending:
+        if pending.endswith(b"\r"):
+            emit_line(pending[:-1], b"\r")
+        else:
+            emit_line(pending, b"")
+    proc.stdout.close()
+    returncode = proc.wait()
+    if stats is not None:
+        stats.update(exit_code=returncode, output_bytes=output_bytes, seconds=time.perf_counter() - started)
+    if raw:
+        out = b"".join(tail).decode("utf-8", errors="replace")
+    else:
+        out = "\n".join(tail) + ("\n" if tail else "")
+    if cancel_event is not None and cancel_event.is_set():
+        return False, out + "Cancelled by user"
+    return returncode == 0, out
+
+def run_cmd(cmd, cwd=None, cancel_event=None, env=None):
+    return stream_cmd(cmd, cwd=cwd, cancel_event=cancel_event, env=env)
+
+def kill_process(proc):
+    # git spawns helpers (remote-https, ssh, pack-objects) that inherit the
+    # pipe; take down the whole group so the read loop sees EOF immediately.
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+class CommandWorker:
+    # Runs git_step() dicts off the Tk thread. Progress is reported as
+    # (kind, cmd, payload) tuples on self.events; the UI polls the queue.
+    def __init__(self):
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self._thread = None
+
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def run(self, steps, on_done=None, trace=None):
+        if self.busy():
+            return False
+        self.cancel_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(steps, on_done, trace), daemon=True)
+        self._thread.start()
+        return True
+
+    def call(self, func, on_done=None):
+        # Runs func() off the Tk thread too, for Python work such as hashing
+        # or index builds. on_done gets its return value, or the exception it
+        # raised, through the same "done" event.
+        if self.busy():
+            return False
+        self._thread = threading.Thread(target=self._call, args=(func, on_done), daemon=True)
+        self._thread.start()
+        return True
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, steps, on_done, trace):
+        ok, results = run_steps(steps, lambda *event: self.events.put(event), self.cancel_event, trace)
+        self.events.put(("done", on_done, (ok, results)))
+
+    def _call(self, func, on_done):
+        try:
+            result = func()
+        except Exception as e:
+            result = e
+        self.events.put(("done", on_done, (True, result)))
+
+def run_steps(steps, emit=None, cancel_event=None, trace=None):
+    # Runs git_step() dicts in order, stopping at the first failure except of
+    # a "may_fail" step, whose result the caller checks. emit, if given,
+    # receives (kind, cmd, payload) events as the steps progress; trace,
+    # from new_trace(), gets a record per step.
+    emit = emit or (lambda kind, cmd, payload: None)
+    results = []
+    for step in steps:
+        cmd = format_cmd(step["args"])
+        failure = step["failure"]
+        if cancel_event is not None and cancel_event.is_set():
+            emit("cancelled", cmd, "")
+            return False, results
+        emit("step", cmd, None)
+        stats = {}
+        started = time.perf_counter()
+        with step["lock"] or contextlib.nullcontext():
+            success, out = stream_cmd(
+                step["args"], cwd=step["cwd"], env=step["env"], input_data=step["input"],
+                on_line=lambda line, cmd=cmd: emit("line", cmd, line),
+                on_progress=lambda phase, pct, cmd=cmd: emit("progress", cmd, (phase, pct)),
+                cancel_event=cancel_event, stats=stats, raw=step.get("raw", False),
+            )
+        record_trace(
+            trace, git_command_name(step["args"]), time.perf_counter() - started, success,
+            stats.get("exit_code"), stats.get("output_bytes"), cmd,
+        )
+        if trace is not None and "seconds" in stats:
+            trace["spawns"]["count"] += 1
+            trace["spawns"]["seconds"] += stats["seconds"]
+        results.append((cmd, success, out))
+        if not success:
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            message = f"{failure}\n{out}" if failure else f"Command failed:\n{cmd}\n{out}"
+            if step.get("may_fail") and not cancelled:
+                emit("line", cmd, message)
+                continue
+            emit("cancelled" if cancelled else "failed", cmd, out if cancelled else message)
+            return False, results
+    return True, results
+
+def find_repo_name_from_url(url):
+    m = re.search(r"/([^/]+?)(?:\.git)?$", url)
+    if m:
+        return m.group(1)
+    return "cloned_repo"
+
+CLONE_MODES = (
+    ("full", "Full clone"),
+    ("blobless", "Blobless (--filter=blob:none, file contents fetched on demand)"),
+    ("shallow", "Shallow dev branch only (--depth 1)"),
+)
+
+def mirror_path_for(url, cache_root):
+    digest = hashlib.sha1(url.strip().encode("utf-8")).hexdigest()[:10]
+    return os.path.join(cache_root, "mirrors", f"{find_repo_name_from_url(url)}-{digest}.git")
+
+def clone_steps(url, tgt_path, mode="full", mirror=None):
+    # With a mirror, objects it already has are copied locally and only the
+    # difference comes over the network; --dissociate keeps the new clone
+    # independent of the cache. Full clones only: --dissociate repacks every
+    # referenced object into the clone, which undoes a filter or a depth.
+    args = ["git", "clone", "--progress"]
+    if mode == "full" and mirror and os.path.isdir(mirror):
+        args += ["--reference-if-able", mirror, "--dissociate"]
+    if mode == "blobless":
+        args.append("--filter=blob:none")
+    elif mode == "shallow":
+        args += ["--depth", "1", "--single-branch", "--branch", "dev"]
+    args += [url, tgt_path]
+    return [git_step(args, None, "Git clone failed:")]
+
+def update_mirror(url, cache_root, seed=None):
+    # Creates the bare mirror on first use, afterwards fetches incrementally.
+    # A new mirror is built under a temporary name so a half-finished one is
+    # never used as a reference. seed is a full clone of url that just
+    # finished: the mirror is copied from it locally (hardlinked where
+    # possible) and only the refs it lacks are fetched, instead of
+    # downloading the whole history a second time.
+    mirror = mirror_path_for(url, cache_root)
+    with repo_lock(mirror):
+        if os.path.isdir(mirror):
+            return run_cmd(["git", "--git-dir", mirror, "fetch", "--prune", "origin"])
+        os.makedirs(os.path.dirname(mirror), exist_ok=True)
+        partial = mirror + ".partial"
+        shutil.rmtree(partial, ignore_errors=True)
+        if seed and os.path.isdir(seed):
+            success, out = run_cmd(["git", "clone", "--mirror", seed, partial])
+            for args in (["remote", "set-url", "origin", url], ["fetch", "--prune", "origin"]):
+                if success:
+                    success, out = run_cmd(["git", "--git-dir", partial] + args)
+        else:
+            success, out = run_cmd(["git", "clone", "--mirror", url, partial])
+        if success:
+            os.replace(partial, mirror)
+        else:
+            shutil.rmtree(partial, ignore_errors=True)
+        return success, out
+
+def start_mirror_update(url, cache_root, seed=None):
+    thread = threading.Thread(target=update_mirror, args=(url, cache_root, seed), daemon=True)
+    thread.start()
+    return thread
+
+def default_changeset_id(story_id):
+    return f'{datetime.datetime.now().strftime("%Y%m%d")}_{story_id}'
+
+def generate_changelog_entry(author, story_id, up_file, down_file, obj_type, changeset_id=None):
+    changeset_id = changeset_id or default_changeset_id(story_id)
+    comment = story_id
+    up_file = up_file.replace("\\", "/")
+    down_file = down_file.replace("\\", "/")
+    if obj_type == "Table":
+        changelog = (
+            f'<changeSet author="{author}" id="{changeset_id}">\n'
+            f'    <comment>{comment}</comment>\n'
+            f'    <sqlFile path="{up_file}" relativeToChangelogFile="true"/>\n'
+            f'    <rollback>\n'
+            f'        <sqlFile path="{down_file}" relativeToChangelogFile="true"/>\n'
+            f'    </rollback>\n'
+            f'</changeSet>'
+        )
+    elif obj_type in ("View", "Procedure"):
+        changelog = (
+            f'<changeSet author="{author}" id="{changeset_id}" runOnChange="true" runInTransaction="true">\n'
+            f'    <comment>{comment}</comment>\n'
+            f'    <sqlFile path="{up_file}" endDelimiter="" encoding="UTF-8"/>\n'
+            f'    <rollback>\n'
+            f'        <sqlFile path="{down_file}" relativeToChangelogFile="true"/>\n'
+            f'    </rollback>\n'
+            f'</changeSet>'
+        )
+    else:
+        changelog = (
+            f'<changeSet author="{author}" id="{changeset_id}">\n'
+            f'    <comment>{comment}</comment>\n'
+            f'    <sqlFile path="{up_file}" relativeToChangelogFile="true"/>\n'
+            f'    <rollback>\n'
+            f'        <sqlFile path="{down_file}" relativeToChangelogFile="true"/>\n'
+            f'    </rollback>\n'
+            f'</changeSet>'
+        )
+    return changelog
+
+class InvalidChangelogError(ValueError):
+    pass
+
+CHANGELOG_CLOSE_TAG = b"</databaseChangeLog>"
+TAIL_CHUNK = 64 * 1024
+
+@contextlib.contextmanager
+def locked_file(f):
+    # Advisory lock held on the changelog itself (a sidecar lock file would
+    # show up in git status), so concurrent appenders take turns.
+    if os.name == "nt":
+        import msvcrt
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def rfind_in_file(f, needle, end):
+    # Offset of the last needle before end, reading backwards in chunks.
+    pos = end
+    carry = b""
+    while pos > 0:
+        start = max(0, pos - TAIL_CHUNK)
+        f.seek(start)
+        chunk = f.read(pos - start) + carry
+        idx = chunk.rfind(needle)
+        if idx != -1:
+            return start + idx
+        carry = chunk[:len(needle) - 1]
+        pos = start
+    return -1
+
+def skip_whitespace_back(f, end):
+    pos = end
+    while pos > 0:
+        start = max(0, pos - TAIL_CHUNK)
+        f.seek(start)
+        chunk = f.read(pos - start)
+        stripped = chunk.rstrip()
+        if stripped:
+            return start + len(stripped)
+        pos = start
+    return 0
+
+def insert_changelog_entry(changelog_path, changelog_entry):
+    # Same result as replacing r"\n*\s*</databaseChangeLog>" in the whole
+    # file, but only the tail is read and rewritten: the closing tag is found
+    # by seeking back from the end, and the file is truncated and extended in
+    # place, so the cost doesn't grow with the changelog.
+    with open(changelog_path, "r+b") as f, locked_file(f):
+        size = f.seek(0, os.SEEK_END)
+        tag = rfind_in_file(f, CHANGELOG_CLOSE_TAG, size)
+        if tag == -1:
+            raise InvalidChangelogError(
+                "Selected file is not a valid changelog XML (missing </databaseChangeLog> tag)."
+            )
+        cut = skip_whitespace_back(f, tag)
+        f.seek(max(0, cut - TAIL_CHUNK))
+        newline = "\r\n" if b"\r\n" in f.read(size - max(0, cut - TAIL_CHUNK)) else "\n"
+        f.seek(tag)
+        trailer = f.read()
+        entry = f"\n{changelog_entry}\n".replace("\r\n", "\n").replace("\n", newline)
+        f.seek(cut)
+        f.write(entry.encode("utf-8") + trailer)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+        update_changelog_index(changelog_path, changelog_entry, size)
+
+CHANGELOG_INDEX_VERSION = 2
+CHANGELOG_INDEX_CHECKPOINTS = 16
+CHANGELOG_INDEX_EXCLUDE = ".*.idx.sqlite*"
+
+class DuplicateChangeSetError(ValueError):
+    pass
+
+def changelog_index_path(changelog_path):
+    folder, name = os.path.split(os.path.abspath(changelog_path))
+    return os.path.join(folder, f".{name}.idx.sqlite")
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def exclude_from_git(path, pattern):
+    # Adds pattern to the enclosing repository's info/exclude (shared by all
+    # worktrees) so index files never show up as untracked.
+    folder = os.path.dirname(os.path.abspath(path))
+    while True:
+        dot_git = os.path.join(folder, ".git")
+        if os.path.isdir(dot_git):
+            common = dot_git
+            break
+        if os.path.isfile(dot_git):
+            with open(dot_git, "r", encoding="utf-8") as f:
+                git_dir = f.read().strip().split("gitdir:", 1)[-1].strip()
+            git_dir = os.path.join(folder, git_dir)
+            common_file = os.path.join(git_dir, "commondir")
+            common = git_dir
+            if os.path.isfile(common_file):
+                with open(common_file, "r", encoding="utf-8") as f:
+                    common = os.path.join(git_dir, f.read().strip())
+            break
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return
+        folder = parent
+    exclude = os.path.join(common, "info", "exclude")
+    try:
+        if os.path.exists(exclude):
+            with open(exclude, "r", encoding="utf-8") as f:
+                if pattern in f.read().splitlines():
+                    return
+        os.makedirs(os.path.dirname(exclude), exist_ok=True)
+        with open(exclude, "a", encoding="utf-8") as f:
+            f.write(f"\n{pattern}\n")
+    except OSError:
+        pass
+
+def open_changelog_index(changelog_path):
+    # The index is a small SQLite file next to the changelog, so lookups and
+    # appends touch a few rows instead of loading every changeSet. An index
+    # from an older layout is dropped and rebuilt.
+    import sqlite3
+    path = changelog_index_path(changelog_path)
+    exclude_from_git(path, CHANGELOG_INDEX_EXCLUDE)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+    if index_meta(conn).get("version") != CHANGELOG_INDEX_VERSION:
+        with conn:
+            for table in ("meta", "changesets", "sql_files", "checkpoints"):
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);"
+        "CREATE TABLE IF NOT EXISTS changesets (id TEXT, author TEXT, position INTEGER);"
+        "CREATE INDEX IF NOT EXISTS changesets_id ON changesets (id, author);"
+        "CREATE TABLE IF NOT EXISTS sql_files (path TEXT, changeset_id TEXT, position INTEGER);"
+        "CREATE INDEX IF NOT EXISTS sql_files_path ON sql_files (path);"
+        "CREATE TABLE IF NOT EXISTS checkpoints (length INTEGER, digest TEXT, count INTEGER);"
+    )
+    return conn
+
+def index_meta(conn):
+    return dict(conn.execute("SELECT key, value FROM meta"))
+
+def set_index_meta(conn, changelog_path, count):
+    stat = os.stat(changelog_path)
+    conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+        ("version", CHANGELOG_INDEX_VERSION), ("size", stat.st_size),
+        ("mtime_ns", stat.st_mtime_ns), ("count", count),
+    ])
+
+def index_changeset(conn, elem, position):
+    # sqlFiles inside <rollback> are not direct children, so only the forward
+    # migration paths are indexed.
+    changeset_id = elem.get("id", "")
+    conn.execute("INSERT INTO changesets VALUES (?, ?, ?)", (changeset_id, elem.get("author", ""), position))
+    for child in elem:
+        if local_name(child.tag) == "sqlFile" and child.get("path"):
+            conn.execute(
+                "INSERT INTO sql_files VALUES (?, ?, ?)", (child.get("path").replace("\\", "/"), changeset_id, position)
+            )
+
+def changelog_body_end(f):
+    # Offset just past the last changeSet, before the whitespace and closing
+    # tag. Appends keep every byte before it, so the bytes up to here are
+    # the part of the file an index checkpoint vouches for.
+    size = f.seek(0, os.SEEK_END)
+    tag = rfind_in_file(f, CHANGELOG_CLOSE_TAG, size)
+    return -1 if tag == -1 else skip_whitespace_back(f, tag)
+
+def prefix_digests(f, lengths, end):
+    # One sequential read of f[:end]; returns {length: sha1 of f[:length]}
+    # for each checkpoint length, plus end itself.
+    h = hashlib.sha1()
+    digests = {}
+    f.seek(0)
+    pos = 0
+    for stop in sorted(set(lengths) | {end}):
+        while pos < stop:
+            chunk = f.read(min(TAIL_CHUNK * 16, stop - pos))
+            if not chunk:
+                return digests
+            h.update(chunk)
+            pos += len(chunk)
+        digests[stop] = h.hexdigest()
+    return digests
+
+def add_checkpoint(conn, length, digest, count):
+    conn.execute("DELETE FROM checkpoints WHERE length = ?", (length,))
+    conn.execute("INSERT INTO checkpoints VALUES (?, ?, ?)", (length, digest, count))
+    conn.execute(
+        "DELETE FROM checkpoints WHERE rowid NOT IN (SELECT rowid FROM checkpoints ORDER BY rowid DESC LIMIT ?)",
+        (CHANGELOG_INDEX_CHECKPOINTS,),
+    )
+
+def build_changelog_index(conn, changelog_path):
+    # iterparse keeps memory flat: each changeSet is dropped from the tree
+    # as soon as it has been indexed.
+    import xml.etree.ElementTree as ET
+    with conn:
+        conn.execute("DELETE FROM changesets")
+        conn.execute("DELETE FROM sql_files")
+        conn.execute("DELETE FROM checkpoints")
+        count = 0
+        depth = 0
+        root = None
+        for event, elem in ET.iterparse(changelog_path, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1 and local_name(elem.tag) == "changeSet":
+                count += 1
+                index_changeset(conn, elem, count)
+                root.clear()
+        with open(changelog_path, "rb") as f:
+            end = changelog_body_end(f)
+            if end != -1:
+                add_checkpoint(conn, end, prefix_digests(f, (), end)[end], count)
+        set_index_meta(conn, changelog_path, count)
+
+def reuse_changelog_index(conn, changelog_path):
+    # The file changed since the index was last trusted, typically because a
+    # checkout swapped a story branch's changelog for dev's. If it starts
+    # with the exact bytes of a checkpoint, cut the index back to that
+    # checkpoint and parse only what follows it. Returns False when no
+    # checkpoint matches, so the caller rebuilds.
+    import xml.etree.ElementTree as ET
+    checkpoints = conn.execute("SELECT length, digest, count FROM checkpoints ORDER BY length DESC").fetchall()
+    with open(changelog_path, "rb") as f:
+        end = changelog_body_end(f)
+        if end == -1:
+            return False
+        digests = prefix_digests(f, [length for length, _, _ in checkpoints if length <= end], end)
+        match = next(((length, count) for length, digest, count in checkpoints if digests.get(length) == digest), None)
+        if match is None:
+            return False
+        length, count = match
+        f.seek(length)
+        tail = f.read(end - length)
+    try:
+        fragment = ET.fromstring(b"<entries>" + tail + b"</entries>")
+    except ET.ParseError:
+        return False
+    with conn:
+        conn.execute("DELETE FROM changesets WHERE position > ?", (count,))
+        conn.execute("DELETE FROM sql_files WHERE position > ?", (count,))
+        for elem in fragment:
+            if local_name(elem.tag) == "changeSet":
+                count += 1
+                index_changeset(conn, elem, count)
+        add_checkpoint(conn, end, digests[end], count)
+        set_index_meta(conn, changelog_path, count)
+    return True
+
+def load_changelog_index(changelog_path):
+    # The persisted index is trusted while the changelog's size and mtime
+    # match what it was built (or last appended) against. Otherwise the
+    # content checkpoints decide whether most of it can be kept.
+    conn = open_changelog_index(changelog_path)
+    meta = index_meta(conn)
+    stat = os.stat(changelog_path)
+    if meta.get("size") != stat.st_size or meta.get("mtime_ns") != stat.st_mtime_ns:
+        if not reuse_changelog_index(conn, changelog_path):
+            build_changelog_index(conn, changelog_path)
+    return conn
+
+def update_changelog_index(changelog_path, changelog_entry, old_size):
+    # Called with the changelog lock held. If the index described the file
+    # as it was before this append, extend it with the new changeSets;
+    # otherwise leave it stale so the next lookup reconciles it. Appends add
+    # no checkpoint, since hashing the prefix would read the whole file.
+    import xml.etree.ElementTree as ET
+    if not os.path.exists(changelog_index_path(changelog_path)):
+        return
+    try:
+        fragment = ET.fromstring(f"<entries>{changelog_entry}</entries>")
+    except ET.ParseError:
+        return
+    with contextlib.closing(open_changelog_index(changelog_path)) as conn, conn:
+        meta = index_meta(conn)
+        if meta.get("size") != old_size:
+            return
+        count = meta["count"]
+        for elem in fragment:
+            if local_name(elem.tag) == "changeSet":
+                count += 1
+                index_changeset(conn, elem, count)
+        set_index_meta(conn, changelog_path, count)
+
+def resolve_changeset_id(changelog_paths, base_id, author, sql_paths, policy="suffix", reserved=()):
+    # Returns (changeset_id, conflicts) across one changelog or a list of
+    # them (a master and its shards). An id already used by this author is
+    # suffixed (_2, _3, ...) or refused, depending on policy; conflicts maps
+    # each sqlFile path that an existing changeSet already runs to its ids.
+    # reserved holds ids taken by earlier changeSets of the same batch,
+    # which are always suffixed around.
+    if isinstance(changelog_paths, str):
+        changelog_paths = [changelog_paths]
+    with contextlib.ExitStack() as stack:
+        conns = [stack.enter_context(contextlib.closing(load_changelog_index(p))) for p in changelog_paths]
+        def taken(changeset_id):
+            return any(
+                conn.execute(
+                    "SELECT 1 FROM changesets WHERE id = ? AND author = ?", (changeset_id, author)
+                ).fetchone() is not None
+                for conn in conns
+            )
+        changeset_id = base_id
+        if base_id in reserved or taken(base_id):
+            if policy == "refuse" and base_id not in reserved:
+                raise DuplicateChangeSetError(f"changeSet id '{base_id}' by {author} already exists in the changelog")
+            n = 2
+            while f"{base_id}_{n}" in reserved or taken(f"{base_id}_{n}"):
+                n += 1
+            changeset_id = f"{base_id}_{n}"
+        conflicts = {}
+        for path in sql_paths:
+            path = path.replace("\\", "/")
+            for conn in conns:
+                rows = conn.execute("SELECT changeset_id FROM sql_files WHERE path = ?", (path,))
+                conflicts.setdefault(path, []).extend(row[0] for row in rows)
+            if not conflicts[path]:
+                del conflicts[path]
+    return changeset_id, conflicts
+
+def resolve_changeset_ids(changelog_paths, base_id, author, sql_paths, policy="suffix"):
+    # One id per forward sqlFile, for a story that adds several changeSets
+    # in one append. Returns (ids, conflicts).
+    ids, conflicts = [], {}
+    for path in sql_paths:
+        changeset_id, found = resolve_changeset_id(changelog_paths, base_id, author, [path], policy, ids)
+        ids.append(changeset_id)
+        conflicts.update(found)
+    return ids, conflicts
+
+MIGRATION_NAME_RE = re.compile(r"^(.+?)[._-](up|down)(\.[^.]*)?$", re.I)
+
+def pair_migration_files(paths):
+    # Matches X_up.sql with X_down.sql (or X.up.sql / X-up.sql, any case).
+    # Returns (pairs, unmatched), pairs in the order the UP files were given.
+    ups, downs, unmatched = {}, {}, []
+    for path in paths:
+        m = MIGRATION_NAME_RE.match(os.path.basename(path))
+        if not m:
+            unmatched.append(path)
+            continue
+        key = (m.group(1).lower(), (m.group(3) or "").lower())
+        side = ups if m.group(2).lower() == "up" else downs
+        if key in side:
+            unmatched.append(path)
+        else:
+            side[key] = path
+    pairs = []
+    for key, up in ups.items():
+        if key in downs:
+            pairs.append((up, downs.pop(key)))
+        else:
+            unmatched.append(up)
+    unmatched.extend(downs.values())
+    return pairs, unmatched
+
+SHARD_MODES = ("off", "monthly", "size")
+DEFAULT_SHARD_MAX_BYTES = 2 * 1024 * 1024
+ROOT_OPEN_RE = re.compile(r"<databaseChangeLog\b[^>]*>")
+INCLUDE_RE = re.compile(r"""<include\b[^>]*\bfile\s*=\s*["']([^"']+)["']""")
+
+def read_root_open_tag(changelog_path):
+    with open(changelog_path, "r", encoding="utf-8") as f:
+        head = f.read(TAIL_CHUNK)
+    m = ROOT_OPEN_RE.search(head)
+    if not m:
+        raise InvalidChangelogError(f"{changelog_path} has no <databaseChangeLog> root element")
+    return m.group(0)
+
+def shard_file_name(master_path, key):
+    stem = os.path.splitext(os.path.basename(master_path))[0]
+    return f"{stem}.{key}.xml"
+
+def included_changelogs(master_path):
+    # Child changelogs referenced by <include>, resolved against the master.
+    # Only meaningful for a thin master, which is cheap to read whole.
+    folder = os.path.dirname(os.path.abspath(master_path))
+    with open(master_path, "r", encoding="utf-8") as f:
+        return [os.path.join(folder, name) for name in INCLUDE_RE.findall(f.read())]
+
+def changelog_family(master_path, mode="off"):
+    # The changelogs to check for duplicates: the master plus every shard it
+    # includes when sharding is on. With sharding off the master is the only
+    # file written to, so it is not read or scanned for includes at all.
+    if mode not in ("monthly", "size"):
+        return [master_path]
+    return [master_path] + [path for path in included_changelogs(master_path) if os.path.isfile(path)]
+
+def write_shard_header(shard_path, open_tag, changesets=(), newline="\n"):
+    with open(shard_path, "x", encoding="utf-8", newline="") as f:
+        f.write(f'<?xml version="1.0" encoding="UTF-8"?>{newline}{open_tag}')
+        for text in changesets:
+            f.write(text)
+        f.write(f"{newline}</databaseChangeLog>{newline}")
+
+def shard_target(master_path, mode, max_bytes=DEFAULT_SHARD_MAX_BYTES):
+    # Picks the child changelog new changeSets go into: the current month's
+    # file, or the newest part under max_bytes. Only the master's last
+    # <include> is ever appended to, so execution order stays append order.
+    # Returns (path, master_changed); a new shard is created and included
+    # from the master the first time it is needed.
+    if mode not in ("monthly", "size"):
+        return master_path, False
+    folder = os.path.dirname(os.path.abspath(master_path))
+    includes = [os.path.basename(path) for path in included_changelogs(master_path)]
+    last = includes[-1] if includes else None
+    if last and not os.path.exists(os.path.join(folder, last)):
+        last = None
+    if mode == "monthly":
+        key = datetime.datetime.now().strftime("%Y-%m")
+        base = shard_file_name(master_path, key)
+        if last and re.fullmatch(re.escape(base[:-len(".xml")]) + r"(-\d+)?\.xml", last):
+            return os.path.join(folder, last), False
+        candidates = (shard_file_name(master_path, f"{key}-{n}") if n > 1 else base for n in itertools.count(1))
+    else:
+        prefix = shard_file_name(master_path, "part-")[:-len(".xml")]
+        if last and last.startswith(prefix) and os.path.getsize(os.path.join(folder, last)) < max_bytes:
+            return os.path.join(folder, last), False
+        numbers = [
+            int(n[len(prefix):-len(".xml")]) for n in os.listdir(folder)
+            if n.startswith(prefix) and n.endswith(".xml") and n[len(prefix):-len(".xml")].isdigit()
+        ]
+        start = max(numbers, default=0) + 1
+        candidates = (shard_file_name(master_path, f"part-{n:04d}") for n in itertools.count(start))
+    open_tag = read_root_open_tag(master_path)
+    for name in candidates:
+        shard_path = os.path.join(folder, name)
+        try:
+            write_shard_header(shard_path, open_tag)
+            break
+        except FileExistsError:
+            continue
+    insert_changelog_entry(master_path, f'<include file="{name}" relativeToChangelogFile="true"/>')
+    return shard_path, True
+
+SPLIT_TOKEN_RE = re.compile(
+    r"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<changeSet\b[^>]*?/>|<changeSet\b.*?</changeSet>|<[A-Za-z][^>]*>",
+    re.S,
+)
+CHANGESET_ID_RE = re.compile(r"""\bid\s*=\s*["'](\d{4})(\d{2})\d{2}""")
+
+def split_changelog(master_path, mode="monthly", max_bytes=DEFAULT_SHARD_MAX_BYTES, logical_path=None):
+    # One-time migration of a monolithic changelog into child files. Each
+    # changeSet is copied byte-for-byte so checksums don't change, and every
+    # child gets logicalFilePath set to the master's logical path so
+    # Liquibase still identifies the changeSets as already deployed.
+    # Non-changeSet elements (includes, properties, preconditions) stay in
+    # the master in their original position, so execution order is kept.
+    with open(master_path, "r", encoding="utf-8", newline="") as f:
+        text = f.read()
+    open_match = ROOT_OPEN_RE.search(text)
+    close_at = text.rfind("</databaseChangeLog>")
+    if not open_match or close_at < open_match.end():
+        raise InvalidChangelogError(f"{master_path} is not a databaseChangeLog")
+    open_tag = open_match.group(0)
+    if "logicalFilePath" not in open_tag:
+        if not logical_path:
+            raise ValueError(
+                "Pass the logical path Liquibase knows this changelog by (e.g. db/changelog.xml); "
+                "without it the moved changeSets would be treated as new."
+            )
+        shard_open_tag = open_tag[:-1].rstrip("/").rstrip() + f' logicalFilePath="{logical_path}">'
+    else:
+        shard_open_tag = open_tag
+
+    folder = os.path.dirname(os.path.abspath(master_path))
+    body_start, body_end = open_match.end(), close_at
+    master_parts = [text[:body_start]]
+    shards = []
+    current = None
+    pending = ""
+    pos = body_start
+    for m in SPLIT_TOKEN_RE.finditer(text, body_start, body_end):
+        token = m.group(0)
+        gap = text[pos:m.start()]
+        pos = m.end()
+        if gap.strip():
+            # Closing tags or text of a non-changeSet element stay in the master.
+            end = len(gap.rstrip())
+            master_parts.append(pending + gap[:end])
+            pending, gap = "", gap[end:]
+            current = None
+        if token.startswith("<!--"):
+            pending += gap + token
+            continue
+        if not token.startswith("<changeSet"):
+            master_parts.append(pending + gap + token)
+            pending = ""
+            current = None
+            continue
+        if mode == "monthly":
+            id_match = CHANGESET_ID_RE.search(token[:token.index(">")])
+            key = f"{id_match.group(1)}-{id_match.group(2)}" if id_match else (current["key"] if current else "undated")
+            new_shard = current is None or current["key"] != key
+        else:
+            key = "part"
+            new_shard = current is None or (current["size"] and current["size"] + len(token) > max_bytes)
+        if new_shard:
+            current = {"key": key, "texts": [], "size": 0}
+            shards.append(current)
+            master_parts.append(current)
+        chunk = pending + gap + token
+        pending = ""
+        current["texts"].append(chunk)
+        current["size"] += len(chunk.encode("utf-8"))
+    master_parts.append(pending + text[pos:])
+
+    used = set()
+    for n, shard in enumerate(shards, 1):
+        key = shard["key"] if mode == "monthly" else f"part-{n:04d}"
+        name = shard_file_name(master_path, key)
+        suffix = 2
+        while name in used or os.path.exists(os.path.join(folder, name)):
+            name = shard_file_name(master_path, f"{key}-{suffix}")
+            suffix += 1
+        used.add(name)
+        shard["name"] = name
+    newline = "\r\n" if "\r\n" in text[:TAIL_CHUNK] else "\n"
+    for shard in shards:
+        write_shard_header(os.path.join(folder, shard["name"]), shard_open_tag, shard["texts"], newline)
+
+    out = []
+    for part in master_parts:
+        if isinstance(part, dict):
+            out.append(f'{newline}    <include file="{part["name"]}" relativeToChangelogFile="true"/>')
+        else:
+            out.append(part)
+    tmp = master_path + ".split.tmp"
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        f.write("".join(out))
+    os.replace(tmp, master_path)
+    return [os.path.join(folder, shard["name"]) for shard in shards]
+
+def describe_sql_conflicts(conflicts):
+    return "\n".join(
+        f"{path} is already run by changeSet {', '.join(ids)}" for path, ids in conflicts.items()
+    )
+
+def append_to_changelog(changelog_path, changelog_entry, trace=None):
+    with trace_span(trace, "append_to_changelog"):
+        insert_changelog_entry(changelog_path, changelog_entry)
+
+def changelog_sql_paths(obj_type, up_path, down_path, changelog_path):
+    # Tables are referenced relativeToChangelogFile; views and procedures
+    # by bare file name.
+    if obj_type == "Table":
+        changelog_dir = os.path.dirname(os.path.abspath(changelog_path))
+        return os.path.relpath(up_path, changelog_dir), os.path.relpath(down_path, changelog_dir)
+    return os.path.basename(up_path), os.path.basename(down_path)
+
+COPY_CHUNK = 1024 * 1024
+COPY_WORKERS = 4
+FICLONE = 0x40049409  # linux/fs.h _IOW(0x94, 9, int)
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(COPY_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+def plan_copy(src, folder):
+    # Sizes rule out most differing destinations before reading them.
+    dest = os.path.join(folder, os.path.basename(src))
+    item = {"src": src, "dest": dest, "bytes": os.path.getsize(src), "sha256": file_digest(src), "dest_sha256": None}
+    if not os.path.exists(dest):
+        item["action"] = "copy"
+    elif os.path.getsize(dest) != item["bytes"]:
+        item["action"] = "overwrite"
+    else:
+        item["dest_sha256"] = file_digest(dest)
+        item["action"] = "skip" if item["dest_sha256"] == item["sha256"] else "overwrite"
+    return item
+
+def plan_copies(copies, max_workers=COPY_WORKERS):
+    # copies holds (source file, target folder) pairs. Each becomes a dict
+    # whose action is "copy" (new), "skip" (identical) or "overwrite".
+    dests = collections.Counter(os.path.normcase(os.path.join(folder, os.path.basename(src))) for src, folder in copies)
+    clashes = sorted(dest for dest, count in dests.items() if count > 1)
+    if clashes:
+        raise ValueError("Several source files would be copied to:\n" + "\n".join(clashes))
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        return list(pool.map(lambda pair: plan_copy(*pair), copies))
+
+def fast_copy(src, dest):
+    # Reflink where the filesystem can share extents (btrfs, XFS), then
+    # in-kernel copy_file_range, then shutil's own copy. Returns the method.
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+        try:
+            import fcntl
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return "reflink"
+        except (ImportError, OSError):
+            pass
+        if hasattr(os, "copy_file_range"):
+            size = os.fstat(fsrc.fileno()).st_size
+            copied = 0
+            try:
+                while copied < size:
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+                    if not n:
+                        break
+                    copied += n
+            except OSError:
+                pass
+            if copied == size:
+                return "copy_file_range"
+    shutil.copyfile(src, dest)
+    return "copyfile"
+
+def copy_verified(item):
+    # Copies through a temporary name so an interrupted copy never leaves a
+    # half-written file in the repository, and checks the result's hash.
+    # The folder may be missing in a worktree slot: one that is new or empty
+    # in the developer's checkout is untracked, so origin/dev lacks it.
+    os.makedirs(os.path.dirname(item["dest"]), exist_ok=True)
+    tmp = f"{item['dest']}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        item["method"] = fast_copy(item["src"], tmp)
+        shutil.copymode(item["src"], tmp)
+        if file_digest(tmp) != item["sha256"]:
+            raise OSError(f"Copy of {item['src']} does not match its source")
+        os.replace(tmp, item["dest"])
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return item
+
+def execute_copies(plan, span=None, max_workers=COPY_WORKERS):
+    # Runs the "copy"/"overwrite" items of a plan_copies result and fills
+    # the trace span with per-file hashes and totals.
+    pending = [item for item in plan if item["action"] != "skip"]
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for future in [pool.submit(copy_verified, item) for item in pending]:
+            future.result()
+    if span is not None:
+        span["copied"] = len(pending)
+        span["skipped"] = len(plan) - len(pending)
+        span["bytes"] = sum(item["bytes"] for item in pending)
+        span["hashes"] = [
+            {"path": item["dest"], "sha256": item["sha256"], "action": item["action"], "method": item.get("method")}
+            for item in plan
+        ]
+    return [item["dest"] for item in plan]
+
+def describe_differing(items):
+    lines = []
+    for item in items:
+        old = item["dest_sha256"][:12] if item["dest_sha256"] else "different size"
+        lines.append(f"{item['dest']} (existing {old}, new {item['sha256'][:12]})")
+    return "\n".join(lines)
+
+PREFLIGHT_VERSION = 1
+PREFLIGHT_WORKERS = 4
+SQL_HEAD_CHARS = 400
+SQL_NORMAL_RE = re.compile(r"--|//|/\*|\$\$|['\";()]")
+SQL_STRING_RE = re.compile(r"\\.|''|'")
+SQL_IDENT_RE = re.compile(r'""|"')
+SQL_NAME = r'(?:"(?:[^"]|"")+"|[\w$]+)'
+SQL_OBJECT_RE = re.compile(
+    r"^\s*(create|drop|alter)\s+(?:or\s+(?:replace|alter)\s+)?"
+    r"(?:(?:secure|temporary|temp|transient|local|global|volatile|materialized|recursive|external|dynamic|hybrid|iceberg)\s+)*"
+    r"(table|view|procedure|function|sequence|stream|task|stage|pipe|schema|file\s+format|masking\s+policy"
+    r"|row\s+access\s+policy|tag|index|trigger|synonym|package|type)\s+"
+    rf"(?:if\s+(?:not\s+)?exists\s+)?({SQL_NAME}(?:\s*\.\s*{SQL_NAME})*)",
+    re.I,
+)
+SQL_OPENERS = {"'": "string literal", '"': "quoted identifier", "/*": "block comment", "$$": "$$ body"}
+GE_RULES = {
+    # kind: (name keys, list keys of which one is required, key each list item needs)
+    "checkpoint": (("name",), ("validations", "validation_definitions", "action_list", "actions"), None),
+    "expectation": (("expectation_suite_name", "name"), ("expectations",), ("expectation_type", "type")),
+}
+
+class PreflightError(ValueError):
+    pass
+
+def sql_object_name(name):
+    # Unquoted identifiers fold to upper case; compared by the last part so
+    # DB.SCHEMA.T in UP matches a bare T in DOWN.
+    last = re.findall(SQL_NAME, name)[-1]
+    return last[1:-1].replace('""', '"') if last.startswith('"') else last.upper()
+
+def sql_summary(path):
+    # Streams the file line by line through a small tokenizer: strings,
+    # quoted identifiers, comments and $$ bodies are skipped, and top-level
+    # ';' ends a statement. Returns the statements' DDL objects and any
+    # unbalanced delimiters.
+    issues, objects = [], []
+    statements = 0
+    state, opened = None, 0
+    depth, head, start = 0, [], None
+
+    def end_statement(line_no):
+        nonlocal statements, depth, head, start
+        text = "".join(head)
+        if text.strip():
+            statements += 1
+            if depth > 0:
+                issues.append({"severity": "error", "line": start, "message": f"{depth} unclosed '(' in statement"})
+            m = SQL_OBJECT_RE.match(text)
+            if m:
+                objects.append({
+                    "verb": m.group(1).upper(), "type": " ".join(m.group(2).upper().split()),
+                    "name": sql_object_name(m.group(3)), "line": start,
+                })
+        depth, head, start = 0, [], None
+
+    def keep(text, line_no):
+        nonlocal start
+        if start is None and text.strip():
+            start = line_no
+        if sum(map(len, head)) < SQL_HEAD_CHARS:
+            head.append(text)
+
+    line_no = 0
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        for line_no, line in enumerate(f, 1):
+            pos = 0
+            while pos < len(line):
+                if state == "$$":
+                    end = line.find("$$", pos)
+                    if end < 0:
+                        break
+                    pos, state = end + 2, None
+                elif state == "/*":
+                    end = line.find("*/", pos)
+                    if end < 0:
+                        break
+                    pos, state = end + 2, None
+                elif state == "'":
+                    m = SQL_STRING_RE.search(line, pos)
+                    if not m:
+                        break
+                    pos = m.end()
+                    if m.group() == "'":
+                        state = None
+                elif state == '"':
+                    m = SQL_IDENT_RE.search(line, pos)
+                    end = m.end() if m else len(line)
+                    keep(line[pos:end], line_no)
+                    pos = end
+                    if m and m.group() == '"':
+                        state = None
+                else:
+                    m = SQL_NORMAL_RE.search(line, pos)
+                    if not m:
+                        keep(line[pos:], line_no)
+                        break
+                    keep(line[pos:m.start()], line_no)
+                    token, pos = m.group(), m.end()
+                    if token in ("--", "//"):
+                        keep("\n", line_no)
+                        break
+                    if token == ";":
+                        end_statement(line_no)
+                    elif token == "(":
+                        depth += 1
+                        keep(token, line_no)
+                    elif token == ")":
+                        depth -= 1
+                        keep(token, line_no)
+                        if depth < 0:
+                            issues.append({"severity": "error", "line": line_no, "message": "')' without a matching '('"})
+                            depth = 0
+                    else:
+                        state, opened = token, line_no
+                        keep({"'": "''", "$$": " $$ ", "/*": " "}.get(token, token), line_no)
+    if state is not None:
+        issues.append({"severity": "error", "line": opened, "message": f"Unterminated {SQL_OPENERS[state]}"})
+    end_statement(line_no)
+    if not statements:
+        issues.append({"severity": "error", "line": None, "message": "No SQL statements"})
+    return {"statements": statements, "objects": objects, "issues": issues}
+
+def check_migration_pair(up_summary, down_summary):
+    # Every object UP creates or changes should be dropped or restored by
+    # DOWN. Names are matched heuristically (a rename pair names different
+    # objects on each side), so mismatches are warnings, not errors.
+    up = {(obj["type"], obj["name"]): obj for obj in up_summary["objects"]}
+    down = {(obj["type"], obj["name"]): obj for obj in down_summary["objects"]}
+    issues = [
+        ("up", {"severity": "warning", "line": obj["line"],
+                "message": f"{obj['verb']} {obj['type']} {obj['name']} has no matching statement in the DOWN file"})
+        for key, obj in up.items() if key not in down
+    ]
+    issues += [
+        ("down", {"severity": "warning", "line": obj["line"],
+                  "message": f"{obj['verb']} {obj['type']} {obj['name']} is not in the UP file"})
+        for key, obj in down.items() if key not in up
+    ]
+    return issues
+
+def ge_summary(path, kind):
+    # Structural checks for Great Expectations checkpoint and expectation
+    # suite files (JSON, or YAML when PyYAML is installed).
+    issues = []
+    def issue(message, severity="error"):
+        issues.append({"severity": severity, "line": None, "message": message})
+    with open(path, "r", encoding="utf-8-sig") as f:
+        try:
+            if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+                try:
+                    import yaml
+                except ImportError:
+                    issue("YAML not checked (pip install pyyaml)", "warning")
+                    return {"issues": issues}
+                data = yaml.safe_load(f)
+            else:
+                data = json.load(f)
+        except ValueError as e:
+            issues.append({"severity": "error", "line": getattr(e, "lineno", None), "message": f"Invalid {kind} file: {e}"})
+            return {"issues": issues}
+        except Exception as e:
+            issue(f"Invalid {kind} file: {e}")
+            return {"issues": issues}
+    name_keys, list_keys, item_keys = GE_RULES[kind]
+    if not isinstance(data, dict):
+        issue(f"A {kind} file must hold an object")
+        return {"issues": issues}
+    if not any(isinstance(data.get(key), str) and data[key].strip() for key in name_keys):
+        issue(f"Missing '{name_keys[0]}'")
+    lists = [key for key in list_keys if key in data]
+    if not lists:
+        issue(f"Missing '{list_keys[0]}'")
+    for key in lists:
+        items = data[key]
+        if not isinstance(items, list):
+            issue(f"'{key}' must be a list")
+            continue
+        if not items:
+            issue(f"'{key}' is empty", "warning")
+        for n, item in enumerate(items, 1):
+            if not isinstance(item, dict):
+                issue(f"'{key}' item {n} must be an object")
+            elif item_keys and not any(isinstance(item.get(k), str) for k in item_keys):
+                issue(f"'{key}' item {n} has no '{item_keys[0]}'")
+            elif "kwargs" in item and not isinstance(item["kwargs"], dict):
+                issue(f"'{key}' item {n}: 'kwargs' must be an object")
+    return {"issues": issues}
+
+def open_preflight_cache(cache_root):
+    import sqlite3
+    os.makedirs(cache_root, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(cache_root, "preflight.sqlite"), timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT)")
+    return conn
+
+def preflight_summaries(files, cache_root=None, max_workers=PREFLIGHT_WORKERS):
+    # files holds (path, kind) pairs, kind being "sql", "checkpoint" or
+    # "expectation". Summaries are cached by content hash, so unchanged
+    # files are not re-read. Returns (summaries, cache hits).
+    checks = {"sql": sql_summary, "checkpoint": lambda p: ge_summary(p, "checkpoint"),
+              "expectation": lambda p: ge_summary(p, "expectation")}
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        keys = [f"{PREFLIGHT_VERSION}:{kind}:{digest}" for (_, kind), digest in
+                zip(files, pool.map(lambda item: file_digest(item[0]), files))]
+        cached = {}
+        conn = open_preflight_cache(cache_root) if cache_root else None
+        try:
+            if conn is not None:
+                for key in set(keys):
+                    row = conn.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        cached[key] = json.loads(row[0])
+            misses = {key: item for key, item in zip(keys, files) if key not in cached}
+            futures = {key: pool.submit(checks[kind], path) for key, (path, kind) in misses.items()}
+            fresh = {key: future.result() for key, future in futures.items()}
+            if conn is not None and fresh:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?)",
+                                     [(key, json.dumps(result)) for key, result in fresh.items()])
+        finally:
+            if conn is not None:
+                conn.close()
+    results = dict(cached, **fresh)
+    return [results[key] for key in keys], sum(key in cached for key in keys)
+
+def run_preflight(pairs=(), ge_files=(), cache_root=None, max_workers=PREFLIGHT_WORKERS):
+    # Checks UP/DOWN pairs and GE (path, kind) files before anything is
+    # copied. Returns (issues, cache hits); each issue carries its path.
+    files = [(path, "sql") for pair in pairs for path in pair] + list(ge_files)
+    summaries, hits = preflight_summaries(files, cache_root, max_workers)
+    issues = [dict(item, path=path) for (path, _), summary in zip(files, summaries) for item in summary["issues"]]
+    for n, (up, down) in enumerate(pairs):
+        if not any(item["severity"] == "error" for summary in summaries[2 * n:2 * n + 2] for item in summary["issues"]):
+            for side, item in check_migration_pair(summaries[2 * n], summaries[2 * n + 1]):
+                issues.append(dict(item, path=up if side == "up" else down))
+    return issues, hits
+
+def preflight_totals(span, issues):
+    span["errors"] = sum(item["severity"] == "error" for item in issues)
+    span["warnings"] = len(issues) - span["errors"]
+    return span["errors"]
+
+def describe_preflight(issues):
+    return "\n".join(
+        f"{item['severity'].upper()}: {os.path.basename(item['path'])}"
+        + (f":{item['line']}" if item["line"] else "") + f": {item['message']}"
+        for item in issues
+    )
+
+STATUS_UNTRACKED_MODES = ("no", "normal", "all")
+STATUS_MAX_PATHSPECS = 1000
+
+def status_options(config):
+    return {
+        "untracked": config.get("status_untracked", "no"),
+        "untracked_cache": config.get("status_untracked_cache", True),
+        "fsmonitor": config.get("status_fsmonitor", False),
+    }
+
+def status_step(repo_path, paths=None, untracked="no", untracked_cache=True, fsmonitor=False):
+    # git status --porcelain=v2 -z. The untracked cache and fsmonitor are
+    # enabled per invocation with -c, so the repo's config is left alone.
+    # paths scope the scan; the stories only commit what they staged, so the
+    # rest of the tree doesn't need to be walked.
+    args = ["git", "--literal-pathspecs"]
+    if untracked_cache:
+        args += ["-c", "core.untrackedCache=true"]
+    if fsmonitor:
+        args += ["-c", "core.fsmonitor=true"]
+    args += ["status", "--porcelain=v2", "-z", f"--untracked-files={untracked}"]
+    if paths and len(paths) <= STATUS_MAX_PATHSPECS:
+        args.append("--")
+        for file_path in paths:
+            try:
+                args.append(os.path.relpath(file_path, repo_path))
+            except ValueError:
+                args.append(file_path)
+    step = git_step(args, repo_path)
+    step["raw"] = True
+    return step
+
+def parse_status_v2(output):
+    # Returns one dict per entry: path, orig_path (renames/copies), the X/Y
+    # status letters, kind and whether it has staged/unstaged changes.
+    changes = []
+    records = iter(output.split("\0"))
+    for record in records:
+        if not record:
+            continue
+        kind = record[0]
+        if kind in "12u":
+            fields = record.split(" ", {"1": 8, "2": 9, "u": 10}[kind])
+            xy = fields[1]
+            change = {"path": fields[-1], "orig_path": None, "index": xy[0], "worktree": xy[1]}
+            if kind == "2":
+                change["orig_path"] = next(records, None)
+                change["kind"] = "renamed" if fields[8].startswith("R") else "copied"
+            else:
+                change["kind"] = "unmerged" if kind == "u" else "changed"
+            change["staged"] = xy[0] != "."
+            change["unstaged"] = xy[1] != "."
+        elif kind in "?!":
+            change = {
+                "path": record[2:], "orig_path": None, "index": kind, "worktree": kind,
+                "kind": "untracked" if kind == "?" else "ignored", "staged": False, "unstaged": True,
+            }
+        else:
+            continue
+        changes.append(change)
+    return changes
+
+def describe_change(change):
+    if change["orig_path"]:
+        return f"{change['index']} {change['orig_path']} -> {change['path']}"
+    letter = change["index"] if change["staged"] else change["worktree"]
+    return f"{letter} {change['path']}"
+
+def describe_changes(changes):
+    staged = [describe_change(c) for c in changes if c["staged"]]
+    unstaged = [
+        f"{c['worktree']} {c['path']}" for c in changes if c["unstaged"] and c["kind"] != "ignored"
+    ]
+    parts = []
+    if staged:
+        parts.append("Staged for commit:\n" + "\n".join("  " + line for line in staged))
+    if unstaged:
+        parts.append("Not staged (left out of the commit):\n" + "\n".join("  " + line for line in unstaged))
+    return "\n\n".join(parts)
+
+def git_get_modified_files(repo_path, paths=None, untracked="normal"):
+    step = status_step(repo_path, paths, untracked)
+    success, output = stream_cmd(step["args"], cwd=repo_path, raw=True)
+    if not success:
+        return []
+    return [change["path"] for change in parse_status_v2(output)]
+
+def is_inside(path, repo_path):
+    return os.path.abspath(path).startswith(os.path.abspath(repo_path))
+
+def story_branch_name(story, branch):
+    return branch if "_" in branch else f"{story}_{branch}"
+
+def commit_message(story, commit_headline):
+    return f"AB#{story}: {commit_headline}"
+
+DEV_FETCH_ARGS = ["git", "fetch", "--progress", "--no-tags", "origin", "+refs/heads/dev:refs/remotes/origin/dev"]
+
+def dev_fetch_step(repo_path):
+    # Only origin/dev is needed to branch a story, so don't fetch every ref.
+    return git_step(DEV_FETCH_ARGS, repo_path, lock=repo_lock(repo_path))
+
+def prepare_branch_steps(repo_path, full_branch, fetch=True):
+    steps = [dev_fetch_step(repo_path)] if fetch else []
+    return steps + [
+        # Same as `checkout dev` + `reset --hard origin/dev`, in one process.
+        git_step(["git", "checkout", "-f", "-B", "dev", "origin/dev"], repo_path),
+        git_step(["git", "checkout", "-b", full_branch], repo_path),
+    ]
+
+def commit_push_steps(repo_path, full_branch, message, git_name, git_email):
+    # The push may fail without failing the run: the commit is made, so the
+    # caller hands the branch to the PushQueue when results[-1] failed.
+    push = git_step(["git", "push", "--progress", "origin", full_branch], repo_path, "Failed to push branch.")
+    push["may_fail"] = True
+    return [
+        git_step(
+            ["git", "commit", "-m", message], repo_path,
+            "Commit failed or no changes to commit.", env=git_identity_env(git_name, git_email),
+        ),
+        push,
+    ]
+
+WORKTREE_KEEP_SLOTS = 4
+WORKTREE_STALE_LOCK_SECONDS = 12 * 3600
+_worktree_lock = threading.Lock()
+_repo_locks = {}
+
+def repo_lock(repo_path):
+    # Serialises fetches into a shared object store across concurrent stories
+    # and the background prefetcher.
+    with _worktree_lock:
+        return _repo_locks.setdefault(os.path.normcase(os.path.abspath(repo_path)), threading.Lock())
+
+def repo_cache_key(repo_path):
+    repo_path = os.path.abspath(repo_path)
+    digest = hashlib.sha1(os.path.normcase(repo_path).encode("utf-8")).hexdigest()[:8]
+    return f"{os.path.basename(repo_path)}-{digest}"
+
+def acquire_worktree_slot(repo_path, cache_root):
+    # Worktrees live in numbered slots under the cache dir and are reused
+    # between stories, so switching story only rewrites the files that differ
+    # from origin/dev. A slot is owned by whoever created its .lock file.
+    base = os.path.join(cache_root, "worktrees", repo_cache_key(repo_path))
+    os.makedirs(base, exist_ok=True)
+    with _worktree_lock:
+        index = 0
+        while True:
+            slot = os.path.join(base, f"slot-{index}")
+            try:
+                fd = os.open(slot + ".lock", os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    stale = time.time() - os.path.getmtime(slot + ".lock") > WORKTREE_STALE_LOCK_SECONDS
+                    if stale:
+                        os.remove(slot + ".lock")
+                        continue
+                except OSError:
+                    continue
+                index += 1
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            return slot
+
+def worktree_branch_steps(repo_path, slot, full_branch):
+    if os.path.exists(os.path.join(slot, ".git")):
+        return [
+            git_step(["git", "checkout", "-f", "-b", full_branch, "origin/dev"], slot),
+            git_step(["git", "clean", "-fd"], slot),
+        ]
+    shutil.rmtree(slot, ignore_errors=True)
+    return [
+        git_step(["git", "worktree", "prune"], repo_path),
+        git_step(["git", "worktree", "add", "-b", full_branch, slot, "origin/dev"], repo_path),
+    ]
+
+def release_worktree_slot(repo_path, slot, keep_slots=WORKTREE_KEEP_SLOTS):
+    # Detach so the story branch can be checked out elsewhere; slots past
+    # keep_slots are removed rather than kept around for reuse.
+    index = int(slot.rsplit("-", 1)[1])
+    if index >= keep_slots:
+        run_cmd(["git", "worktree", "remove", "--force", slot], cwd=repo_path)
+    elif os.path.exists(os.path.join(slot, ".git")):
+        run_cmd(["git", "checkout", "-f", "--detach"], cwd=slot)
+    try:
+        os.remove(slot + ".lock")
+    except OSError:
+        pass
+
+def map_to_workdir(path, repo_path, workdir):
+    # Paths picked inside the developer's checkout point at the same place in
+    # the story's worktree.
+    if os.path.normcase(os.path.abspath(workdir)) == os.path.normcase(os.path.abspath(repo_path)):
+        return path
+    if is_inside(path, workdir):
+        return path
+    return os.path.join(workdir, os.path.relpath(os.path.abspath(path), os.path.abspath(repo_path)))
+
+PREFETCH_INTERVAL = 90
+PREFETCH_MAX_AGE = 120
+PREFETCH_FETCH_SLACK = 30
+
+def prefetch_settings(config):
+    # (interval, max_age). max_age defaults to at least one interval plus
+    # time for the fetch itself, so a background fetch that keeps to its
+    # schedule always counts as fresh.
+    interval = config.get("prefetch_interval", PREFETCH_INTERVAL)
+    max_age = config.get("prefetch_max_age", max(PREFETCH_MAX_AGE, interval + PREFETCH_FETCH_SLACK))
+    return interval, max_age
+
+class Prefetcher:
+    # Keeps origin/dev of the selected repo current in the background so
+    # Start Automation can usually skip its fetch. interval <= 0 fetches once
+    # on selection only.
+    def __init__(self, interval=PREFETCH_INTERVAL):
+        self.interval = interval
+        self.repo_path = None
+        self.last_fetch = {}
+        self.last_error = {}
+        self._wake = threading.Event()
+        self._thread = None
+
+    def watch(self, repo_path, fetch_now=True):
+        self.repo_path = repo_path
+        if not fetch_now:
+            self.mark_fresh(repo_path)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        elif fetch_now:
+            self._wake.set()
+
+    def mark_fresh(self, repo_path):
+        key = os.path.normcase(os.path.abspath(repo_path))
+        self.last_fetch[key] = time.time()
+        self.last_error.pop(key, None)
+
+    def age(self, repo_path):
+        fetched = self.last_fetch.get(os.path.normcase(os.path.abspath(repo_path)))
+        return None if fetched is None else time.time() - fetched
+
+    def is_fresh(self, repo_path, max_age):
+        age = self.age(repo_path)
+        return age is not None and age <= max_age
+
+    def fetch(self, repo_path):
+        with repo_lock(repo_path):
+            success, out = run_cmd(DEV_FETCH_ARGS, cwd=repo_path)
+        if success:
+            self.mark_fresh(repo_path)
+        else:
+            self.last_error[os.path.normcase(os.path.abspath(repo_path))] = out.strip()
+        return success
+
+    def _loop(self):
+        skip_fetch = self.repo_path is not None and self.age(self.repo_path) is not None
+        while True:
+            if self.repo_path and not skip_fetch:
+                self.fetch(self.repo_path)
+            skip_fetch = False
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            self._wake.clear()
+
+PUSH_QUEUE_FILE = "push_queue.json"
+PUSH_RETRY_BASE = 30
+PUSH_RETRY_MAX = 3600
+PUSH_PORCELAIN_RE = re.compile(r"^([ +\-*!=])\t([^\t:]*):([^\t]+)\t(.*)$")
+
+def push_queue_path():
+    # Next to config.json, so it is shared by every run started from there.
+    return os.path.join(os.path.dirname(os.path.abspath(CONFIG_FILE)), PUSH_QUEUE_FILE)
+
+def branch_refspec(branch):
+    return f"refs/heads/{branch}:refs/heads/{branch}"
+
+def parse_push_porcelain(output):
+    # `git push --porcelain` prints "<flag>\t<src>:<dst>\t<summary>" per ref;
+    # "!" is a rejection, anything else means the remote has the commit.
+    refs = {}
+    for line in output.splitlines():
+        m = PUSH_PORCELAIN_RE.match(line)
+        if m:
+            refs[m.group(3)] = (m.group(1) != "!", m.group(4).strip())
+    return refs
+
+class PushQueue:
+    # Committed branches whose push failed. The queue is a JSON file that
+    # every change re-reads under a lock, so the GUI, headless runs and a
+    # restarted app all see the same entries. Due entries are retried with
+    # exponential backoff, one multi-refspec push per repo and remote.
+    def __init__(self, path=None, base_delay=PUSH_RETRY_BASE, max_delay=PUSH_RETRY_MAX):
+        self.path = path or push_queue_path()
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._wake = threading.Event()
+        self._thread = None
+
+    def delay(self, attempts):
+        return min(self.max_delay, self.base_delay * 2 ** max(0, attempts - 1))
+
+    def _update(self, change=None):
+        with open(self.path, "a+", encoding="utf-8") as f:
+            with locked_file(f):
+                f.seek(0)
+                text = f.read()
+                try:
+                    entries = json.loads(text) if text.strip() else []
+                except ValueError:
+                    entries = []
+                if change is None:
+                    return entries
+                result = change(entries)
+                f.seek(0)
+                f.truncate()
+                json.dump(entries, f, indent=2)
+                return result
+
+    def pending(self):
+        if not os.path.exists(self.path):
+            return []
+        return self._update()
+
+    def add(self, repo_path, branch, error, remote="origin"):
+        now = time.time()
+        entry = {
+            "repo": os.path.abspath(repo_path), "remote": remote, "branch": branch, "attempts": 1,
+            "queued_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "next_try": now + self.delay(1), "last_error": push_error_tail(error),
+        }
+        def change(entries):
+            entries[:] = [e for e in entries if push_key(e) != push_key(entry)] + [entry]
+        self._update(change)
+        self._wake.set()
+        return entry
+
+    def next_due(self):
+        entries = self.pending()
+        return min((e["next_try"] for e in entries), default=None)
+
+    def retry(self, force=False, repos=None):
+        # Pushes every repo/remote group that has a due entry (all groups if
+        # force). Returns one outcome dict per branch attempted.
+        now = time.time()
+        groups = {}
+        for entry in self.pending():
+            if repos is None or os.path.normcase(entry["repo"]) in repos:
+                groups.setdefault((os.path.normcase(entry["repo"]), entry["remote"]), []).append(entry)
+        outcomes = []
+        for group in groups.values():
+            if force or any(e["next_try"] <= now for e in group):
+                outcomes += self.push_group(group)
+        if outcomes:
+            self._settle(outcomes)
+        return outcomes
+
+    def push_group(self, group):
+        repo, remote = group[0]["repo"], group[0]["remote"]
+        trace = new_trace("push queue", repo)
+        with trace_span(trace, "push retry", branches=len(group)) as span:
+            if os.path.isdir(repo):
+                args = ["git", "push", "--porcelain", remote] + [branch_refspec(e["branch"]) for e in group]
+                with repo_lock(repo):
+                    _, out = run_cmd(args, cwd=repo)
+            else:
+                out = f"Repository not found: {repo}"
+            refs = parse_push_porcelain(out)
+            lines = [line for line in out.splitlines() if line.strip() and line.strip() != "Done"]
+            outcomes = []
+            for e in group:
+                ok, summary = refs.get(f"refs/heads/{e['branch']}", (False, lines[-1] if lines else "Push failed"))
+                outcomes.append(dict(e, ok=ok, error=None if ok else summary))
+            span["pushed"] = sum(o["ok"] for o in outcomes)
+        return outcomes
+
+    def _settle(self, outcomes):
+        now = time.time()
+        done = {push_key(o): o for o in outcomes}
+        def change(entries):
+            kept = []
+            for entry in entries:
+                outcome = done.get(push_key(entry))
+                if outcome is None:
+                    kept.append(entry)
+                elif not outcome["ok"]:
+                    entry["attempts"] += 1
+                    entry["next_try"] = now + self.delay(entry["attempts"])
+                    entry["last_error"] = outcome["error"]
+                    kept.append(entry)
+            entries[:] = kept
+        self._update(change)
+
+    def drain(self, timeout, repos=None):
+        # Retries in-line until the given repos' entries are pushed or
+        # timeout seconds pass; for headless runs with no GUI to keep alive.
+        deadline = time.monotonic() + timeout
+        outcomes = []
+        while True:
+            outcomes += [o for o in self.retry(repos=repos) if o["ok"]]
+            waiting = [e for e in self.pending() if repos is None or os.path.normcase(e["repo"]) in repos]
+            if not waiting:
+                return outcomes
+            wait = min(e["next_try"] for e in waiting) - time.time()
+            if time.monotonic() + max(0, wait) > deadline:
+                return outcomes
+            time.sleep(max(0, wait))
+
+    def start(self, on_change=None, poll=60):
+        # Background retries for the GUI. on_change gets each batch of
+        # outcomes from the worker thread; poll also picks up entries that
+        # other processes added.
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, args=(on_change, poll), daemon=True)
+            self._thread.start()
+
+    def _loop(self, on_change, poll):
+        while True:
+            try:
+                outcomes = self.retry()
+                due = self.next_due()
+            except OSError:
+                outcomes, due = [], None
+            if outcomes and on_change is not None:
+                on_change(outcomes)
+            wait = poll if due is None else min(poll, max(1, due - time.time()))
+            self._wake.wait(wait)
+            self._wake.clear()
+
+def push_error_tail(output):
+    # The rejection line and git's summary, without the progress chatter.
+    return "\n".join([line.strip() for line in output.splitlines() if line.strip()][-2:])
+
+def push_key(entry):
+    return os.path.normcase(entry["repo"]), entry["remote"], entry["branch"]
+
+def describe_pending_pushes(entries):
+    return "\n".join(
+        f"{os.path.basename(e['repo'])}: {e['branch']} ({e['attempts']} failed, next try "
+        f"{datetime.datetime.fromtimestamp(e['next_try']).strftime('%H:%M:%S')}): {e['last_error']}"
+        for e in entries
+    )
+
+def describe_age(seconds):
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min ago"
+    return f"{int(seconds // 3600)} h ago"
+
+REPO_SCAN_DEPTH = 4
+REPO_SCAN_PRUNE = {"node_modules", "bower_components", "__pycache__", "venv", "site-packages"}
+GIT_CONFIG_SECTION_RE = re.compile(r'^\s*\[\s*remote\s+"([^"]+)"\s*\]')
+GIT_CONFIG_URL_RE = re.compile(r"^\s*url\s*=\s*(.+?)\s*$")
+
+def resolve_git_dir(repo_path):
+    # .git is a directory for normal clones and a "gitdir: ..." file for
+    # worktrees and submodules.
+    dot_git = os.path.join(repo_path, ".git")
+    if os.path.isdir(dot_git):
+        return dot_git
+    try:
+        with open(dot_git, "r", encoding="utf-8") as f:
+            line = f.readline().strip()
+    except OSError:
+        return None
+    if not line.startswith("gitdir:"):
+        return None
+    return os.path.normpath(os.path.join(repo_path, line[len("gitdir:"):].strip()))
+
+def common_git_dir(repo_path):
+    # Where objects and config live; a worktree's own gitdir points there
+    # through its "commondir" file.
+    git_dir = resolve_git_dir(repo_path)
+    if not git_dir:
+        return None
+    try:
+        with open(os.path.join(git_dir, "commondir"), "r", encoding="utf-8") as f:
+            return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except OSError:
+        return git_dir
+
+def read_repo_info(repo_path):
+    # Reads HEAD and config directly instead of spawning git, so indexing
+    # hundreds of repos stays cheap on network home directories.
+    info = {"branch": "", "remote": ""}
+    git_dir = resolve_git_dir(repo_path)
+    if not git_dir:
+        return info
+    try:
+        with open(os.path.join(git_dir, "HEAD"), "r", encoding="utf-8") as f:
+            head = f.read().strip()
+        if head.startswith("ref: refs/heads/"):
+            info["branch"] = head[len("ref: refs/heads/"):]
+        elif head:
+            info["branch"] = f"(detached {head[:7]})"
+    except OSError:
+        pass
+    common_dir = common_git_dir(repo_path)
+    remotes = {}
+    try:
+        with open(os.path.join(common_dir, "config"), "r", encoding="utf-8", errors="replace") as f:
+            remote = None
+            for line in f:
+                if line.lstrip().startswith("["):
+                    m = GIT_CONFIG_SECTION_RE.match(line)
+                    remote = m.group(1) if m else None
+                elif remote and remote not in remotes:
+                    m = GIT_CONFIG_URL_RE.match(line)
+                    if m:
+                        remotes[remote] = m.group(1)
+    except OSError:
+        pass
+    info["remote"] = remotes.get("origin") or next(iter(remotes.values()), "")
+    return info
+
+def scan_repos(folder, depth=REPO_SCAN_DEPTH, previous=None):
+    # Walks folder for git repositories, up to depth levels below it, without
+    # descending into repos, hidden folders or REPO_SCAN_PRUNE. previous is
+    # an earlier result: a directory whose mtime has not changed reuses its
+    # recorded children instead of being listed again.
+    folder = os.path.abspath(folder)
+    old_dirs = (previous or {}).get("dirs", {})
+    dirs, repos = {}, {}
+    stack = [(folder, 0)]
+    while stack:
+        path, level = stack.pop()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        cached = old_dirs.get(path)
+        if cached and cached[0] == mtime:
+            is_repo, children = cached[1], cached[2]
+        else:
+            is_repo, children = False, []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.name == ".git":
+                            is_repo = True
+                        elif (
+                            not entry.name.startswith(".")
+                            and entry.name not in REPO_SCAN_PRUNE
+                            and entry.is_dir(follow_symlinks=False)
+                        ):
+                            children.append(entry.name)
+            except OSError:
+                continue
+            children.sort()
+        dirs[path] = [mtime, is_repo, children]
+        if is_repo:
+            repos[path] = read_repo_info(path)
+        elif level < depth:
+            stack.extend((os.path.join(path, name), level + 1) for name in reversed(children))
+    return {"scanned": time.time(), "dirs": dirs, "repos": repos}
+
+def refresh_repo_index(index, depth=REPO_SCAN_DEPTH):
+    # index maps each scanned root folder to its scan_repos result.
+    return {folder: scan_repos(folder, depth, previous) for folder, previous in index.items()}
+
+def indexed_repos(index):
+    repos = {}
+    for scan in index.values():
+        repos.update(scan.get("repos", {}))
+    return sorted(repos.items())
+
+def filter_repos(repos, text):
+    terms = text.lower().split()
+    return [
+        (path, info) for path, info in repos
+        if all(term in f"{path} {info.get('branch', '')} {info.get('remote', '')}".lower() for term in terms)
+    ]
+
+_remote_url_cache = {}
+
+def get_remote_url(repo_path, remote="origin"):
+    key = (os.path.abspath(repo_path), remote)
+    if key not in _remote_url_cache:
+        success, out = run_cmd(["git", "config", "--get", f"remote.{remote}.url"], cwd=repo_path)
+        _remote_url_cache[key] = out.strip() if success else ""
+    return _remote_url_cache[key]
+
+def get_github_pr_url(repo_path, branch):
+    url = get_remote_url(repo_path)
+    if url:
+        match = re.search(r"github\.com[/:](.+?)/(.+?)(?:\.git)?$", url)
+        if match:
+            owner, repository = match.group(1), match.group(2)
+            return f"https://github.com/{owner}/{repository}/pull/new/{branch}"
+    return None
+
+RESULT_COLUMNS = (("repo", "Repository"), ("status", "Status"), ("branch", "Branch"), ("pr_url", "PR URL / Error"))
+
+def result_outcome(result):
+    if result["pr_url"]:
+        return result["pr_url"]
+    # The last line of a failed command's output is usually the "fatal: ..." one.
+    lines = [line for line in (result["error"] or "").splitlines() if line.strip()]
+    return lines[-1].strip() if lines else ""
+
+def format_results_table(results):
+    rows = [[label for _, label in RESULT_COLUMNS]]
+    for r in results:
+        rows.append([r["repo"], r["status"], r["branch"], result_outcome(r)])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(RESULT_COLUMNS) - 1)]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)) + "  " + row[-1] for row in rows
+    )
+
+WORKFLOW_MODES = {"db": "DB Objects", "db objects": "DB Objects", "ge": "GE Scripts", "ge scripts": "GE Scripts"}
+OBJECT_TYPES = ("Table", "View", "Procedure")
+MANIFEST_SOURCE_FIELDS = ("up_file", "down_file", "checkpoint_file", "expectation_file")
+MANIFEST_REPO_FIELDS = ("target_folder", "checkpoint_target", "expectation_target", "changelog")
+
+def load_manifest(path):
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if ext == ".csv":
+            import csv
+            data = list(csv.DictReader(f))
+        elif ext in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("YAML manifests require PyYAML (pip install pyyaml)")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("stories", [])
+    if not isinstance(data, list):
+        raise ValueError("Manifest must be a list of stories or {\"stories\": [...]}")
+    base_dir = os.path.dirname(os.path.abspath(path))
+    return [
+        normalize_manifest_entry(one, base_dir, n)
+        for n, raw in enumerate(data, 1)
+        for one in expand_fan_out(raw, n)
+    ]
+
+def expand_fan_out(raw, number):
+    # "repos" (a list, or ";"-separated in CSV) applies one story to several
+    # repositories; repo-relative fields are resolved against each of them.
+    repos = raw.get("repos")
+    if not repos:
+        return [raw]
+    if raw.get("repo"):
+        raise ValueError(f"Manifest entry {number}: give either 'repo' or 'repos', not both")
+    if isinstance(repos, str):
+        repos = repos.split(";")
+    base = {k: v for k, v in raw.items() if k != "repos"}
+    return [dict(base, repo=repo.strip()) for repo in repos if repo and repo.strip()]
+
+def normalize_manifest_entry(raw, base_dir, number):
+    # Source files and the repo resolve against the manifest's folder; target
+    # folders and the changelog resolve against the repo.
+    entry = {k: v.strip() if isinstance(v, str) else v for k, v in raw.items() if v not in (None, "")}
+    for field in ("story_id", "commit_headline", "repo"):
+        if not entry.get(field):
+            raise ValueError(f"Manifest entry {number}: '{field}' is required")
+    mode = WORKFLOW_MODES.get(str(entry.get("mode", "DB Objects")).lower())
+    if mode is None:
+        raise ValueError(f"Manifest entry {number}: unknown mode '{entry['mode']}'")
+    entry["mode"] = mode
+    entry["repo"] = os.path.abspath(os.path.join(base_dir, entry["repo"]))
+    for field in MANIFEST_SOURCE_FIELDS:
+        if field in entry:
+            entry[field] = os.path.abspath(os.path.join(base_dir, entry[field]))
+    for field in MANIFEST_REPO_FIELDS:
+        if field in entry:
+            entry[field] = os.path.abspath(os.path.join(entry["repo"], entry[field]))
+    if mode == "GE Scripts":
+        required = ("checkpoint_file", "expectation_file", "checkpoint_target", "expectation_target")
+    elif "migrations" in entry:
+        required = ("target_folder",)
+    else:
+        required = ("up_file", "down_file", "target_folder")
+    for field in required:
+        if field not in entry:
+            raise ValueError(f"Manifest entry {number}: '{field}' is required for {mode}")
+    for field in ("worktree", "overwrite", "preflight"):
+        if isinstance(entry.get(field), str):
+            entry[field] = entry[field].lower() in ("1", "true", "yes", "y")
+    obj_type = entry.get("object_type")
+    if obj_type is not None and obj_type not in OBJECT_TYPES:
+        raise ValueError(f"Manifest entry {number}: object_type must be one of {', '.join(OBJECT_TYPES)}")
+    if mode == "DB Objects":
+        entry["migrations"] = normalize_migrations(entry, base_dir, number)
+    return entry
+
+def normalize_migrations(entry, base_dir, number):
+    # A story's UP/DOWN pairs: the "migrations" list, or the single
+    # up_file/down_file/object_type of the entry. A pair without an
+    # object_type falls back to the entry's, and gets no changeSet if
+    # neither is set.
+    items = entry.get("migrations")
+    if items is None:
+        items = [{"up_file": entry["up_file"], "down_file": entry["down_file"]}]
+    if not isinstance(items, list) or not items:
+        raise ValueError(f"Manifest entry {number}: 'migrations' must be a non-empty list")
+    migrations = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("up_file") or not item.get("down_file"):
+            raise ValueError(f"Manifest entry {number}: each migration needs 'up_file' and 'down_file'")
+        obj_type = item.get("object_type") or entry.get("object_type")
+        if obj_type is not None and obj_type not in OBJECT_TYPES:
+            raise ValueError(f"Manifest entry {number}: object_type must be one of {', '.join(OBJECT_TYPES)}")
+        migrations.append({
+            "up_file": os.path.abspath(os.path.join(base_dir, item["up_file"])),
+            "down_file": os.path.abspath(os.path.join(base_dir, item["down_file"])),
+            "object_type": obj_type,
+        })
+    return migrations
+
+def run_story(entry, settings, log=None):
+    # Non-interactive version of start_automation for one manifest entry.
+    # settings holds username/git_name/git_email plus the optional
+    # worktrees/cache_dir defaults.
+    story = entry["story_id"]
+    repo_path = entry["repo"]
+    full_branch = story_branch_name(story, entry.get("branch") or settings["username"])
+    use_worktree = entry.get("worktree", settings.get("worktrees", False))
+    result = {
+        "story_id": story, "repo": repo_path, "branch": full_branch, "worktree": None,
+        "status": "failed", "error": None, "changelog": None, "pr_url": None,
+    }
+    log = log or (lambda line: None)
+    trace = new_trace("story", repo_path, story)
+    started = time.perf_counter()
+    failures = []
+    def emit(kind, cmd, payload):
+        if kind == "step":
+            log(f"[{story}] $ {cmd}")
+        elif kind == "line":
+            log(f"[{story}] {payload}")
+        elif kind in ("failed", "cancelled"):
+            failures.append(payload or f"Cancelled: {cmd}")
+    def run_or_raise(steps):
+        ok, results = run_steps(steps, emit, trace=trace)
+        if not ok:
+            raise RuntimeError(failures[-1] if failures else "Command failed")
+        return results
+
+    slot = None
+    try:
+        if entry["mode"] == "GE Scripts":
+            copies = [
+                (entry["checkpoint_file"], entry["checkpoint_target"]),
+                (entry["expectation_file"], entry["expectation_target"]),
+            ]
+        else:
+            copies = [
+                (path, entry["target_folder"])
+                for migration in entry["migrations"]
+                for path in (migration["up_file"], migration["down_file"])
+            ]
+        for src, folder in copies:
+            if not os.path.isfile(src):
+                raise ValueError(f"Source file not found: {src}")
+            if not is_inside(folder, repo_path):
+                raise ValueError(f"Target folder must be inside repository: {folder}")
+        if entry.get("preflight", settings.get("preflight", True)):
+            if entry["mode"] == "GE Scripts":
+                pairs, ge_files = [], [(entry["checkpoint_file"], "checkpoint"), (entry["expectation_file"], "expectation")]
+            else:
+                pairs, ge_files = [(m["up_file"], m["down_file"]) for m in entry["migrations"]], []
+            with trace_span(trace, "preflight", files=len(copies)) as span:
+                issues, span["cached"] = run_preflight(pairs, ge_files, settings.get("cache_dir"))
+                if preflight_totals(span, issues):
+                    raise PreflightError("Preflight failed:\n" + describe_preflight(issues))
+            for line in describe_preflight(issues).splitlines():
+                log(f"[{story}] {line}")
+
+        if use_worktree:
+            run_or_raise([dev_fetch_step(repo_path)])
+            slot = acquire_worktree_slot(repo_path, settings.get("cache_dir") or DEFAULT_CACHE_DIR)
+            result["worktree"] = slot
+            run_or_raise(worktree_branch_steps(repo_path, slot, full_branch))
+            workdir = slot
+        else:
+            run_or_raise(prepare_branch_steps(repo_path, full_branch))
+            workdir = repo_path
+
+        copies = [(src, map_to_workdir(folder, repo_path, workdir)) for src, folder in copies]
+        # Planning (hashing) and copying are separate spans, the same stages
+        # the GUI records around its overwrite question.
+        with trace_span(trace, "copy plan", files=len(copies)) as span:
+            plan = plan_copies(copies)
+            differing = [item for item in plan if item["action"] == "overwrite"]
+            span["differing"] = len(differing)
+        if differing and not entry.get("overwrite", settings.get("overwrite_differing", False)):
+            raise FileExistsError(
+                "Target files already exist with different content (set overwrite to replace them):\n"
+                + describe_differing(differing)
+            )
+        with trace_span(trace, "copy", files=len(copies)) as span:
+            files_to_add = execute_copies(plan, span)
+
+        changelog_path = entry.get("changelog")
+        typed = [
+            (migration["object_type"], files_to_add[2 * n], files_to_add[2 * n + 1])
+            for n, migration in enumerate(entry.get("migrations", []))
+            if migration["object_type"]
+        ]
+        if entry["mode"] == "DB Objects" and typed and changelog_path:
+            changelog_path = map_to_workdir(changelog_path, repo_path, workdir)
+            sql_paths = [changelog_sql_paths(obj_type, up, down, changelog_path) for obj_type, up, down in typed]
+            changeset_ids, conflicts = resolve_changeset_ids(
+                changelog_family(changelog_path, settings.get("changelog_shard", "off")),
+                default_changeset_id(story), settings["username"],
+                [up_rel for up_rel, _ in sql_paths], settings.get("duplicate_changesets", "suffix"),
+            )
+            if conflicts:
+                raise DuplicateChangeSetError(describe_sql_conflicts(conflicts))
+            changelog_entry = "\n".join(
+                generate_changelog_entry(settings["username"], story, up_rel, down_rel, obj_type, changeset_id)
+                for (obj_type, _, _), (up_rel, down_rel), changeset_id in zip(typed, sql_paths, changeset_ids)
+            )
+            target, master_changed = shard_target(
+                changelog_path, settings.get("changelog_shard", "off"),
+                settings.get("changelog_shard_max_bytes", DEFAULT_SHARD_MAX_BYTES),
+            )
+            with trace_span(trace, "append_to_changelog", changesets=len(typed)):
+                insert_changelog_entry(target, changelog_entry)
+            files_to_add.append(target)
+            if master_changed:
+                files_to_add.append(changelog_path)
+            result["changelog"] = target
+
+        results = run_or_raise([
+            git_add_step(workdir, files_to_add),
+            status_step(workdir, files_to_add, **status_options(settings)),
+        ])
+        if not any(change["staged"] for change in parse_status_v2(results[-1][2])):
+            raise RuntimeError("No modified/new files to commit.")
+        results = run_or_raise(commit_push_steps(
+            workdir, full_branch, commit_message(story, entry["commit_headline"]),
+            settings["git_name"], settings["git_email"],
+        ))
+        if results[-1][1]:
+            result["status"] = "ok"
+            result["pr_url"] = get_github_pr_url(repo_path, full_branch)
+        else:
+            push_queue(settings).add(repo_path, full_branch, results[-1][2])
+            result["status"] = "queued"
+            result["error"] = "Push failed; queued for retry:\n" + results[-1][2]
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        if slot is not None:
+            release_worktree_slot(repo_path, slot)
+        record_trace(
+            trace, "story total", time.perf_counter() - started, result["status"] == "ok",
+            spawns=trace["spawns"]["count"], spawn_seconds=round(trace["spawns"]["seconds"], 6),
+        )
+    return result
+
+def push_queue(config):
+    return PushQueue(
+        config.get("push_queue_file"), config.get("push_retry_base", PUSH_RETRY_BASE),
+        config.get("push_retry_max", PUSH_RETRY_MAX),
+    )
+
+STORY_CONFIG_KEYS = (
+    "duplicate_changesets", "changelog_shard", "changelog_shard_max_bytes",
+    "status_untracked", "status_untracked_cache", "status_fsmonitor", "overwrite_differing", "preflight",
+    "push_queue_file", "push_retry_base", "push_retry_max",
+)
+
+def story_settings(config):
+    # run_story settings that come from config.json; the caller adds the
+    # username and git identity.
+    settings = {"worktrees": config.get("use_worktrees", False), "cache_dir": cache_dir(config)}
+    for key in STORY_CONFIG_KEYS:
+        if key in config:
+            settings[key] = config[key]
+    return settings
+
+def run_manifest(entries, settings, max_workers=4, log=None):
+    # Stories in the same checkout run one after another; different repos,
+    # and stories that each get their own worktree, run concurrently.
+    groups = {}
+    for index, entry in enumerate(entries):
+        if entry.get("worktree", settings.get("worktrees", False)):
+            key = ("worktree", index)
+        else:
+            key = os.path.normcase(entry["repo"])
+        groups.setdefault(key, []).append(index)
+    results = [None] * len(entries)
+    def run_group(indexes):
+        for index in indexes:
+            results[index] = run_story(entries[index], settings, log)
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for future in [pool.submit(run_group, indexes) for indexes in groups.values()]:
+            future.result()
+    return results
+
+def cli_clone(args, config):
+    cache_root = cache_dir(config)
+    tgt_path = os.path.join(args.dest or os.getcwd(), find_repo_name_from_url(args.clone))
+    mirror = None if args.no_mirror else mirror_path_for(args.clone, cache_root)
+    trace = new_trace("clone", tgt_path)
+    ok, results = run_steps(
+        clone_steps(args.clone, tgt_path, args.clone_mode, mirror),
+        lambda kind, cmd, payload: print(payload, file=sys.stderr) if kind == "line" else None,
+        trace=trace,
+    )
+    if not ok:
+        print("Git clone failed", file=sys.stderr)
+    if ok and mirror:
+        # No GUI to keep the process alive, so refresh the mirror in-line.
+        print(f"Updating mirror {mirror}", file=sys.stderr)
+        with trace_span(trace, "mirror update"):
+            update_mirror(args.clone, cache_root, tgt_path if args.clone_mode == "full" else None)
+    if ok:
+        print(tgt_path)
+    return 0 if ok else 1
+
+def cli_trace_summary(args, config):
+    path = TRACE_SETTINGS["path"] or config.get("trace_file") or os.path.join(cache_dir(config), "trace.jsonl")
+    paths = trace_files(path)
+    if not paths:
+        print(f"No trace log at {path}", file=sys.stderr)
+        return 1
+    since = time.time() - args.since_days * 86400 if args.since_days else None
+    print(format_trace_summary(summarize_traces(paths, since)))
+    return 0
+
+def cli_split_changelog(args):
+    try:
+        shards = split_changelog(args.split_changelog, args.shard_by, args.max_bytes, args.logical_path)
+    except (OSError, ValueError) as e:
+        print(f"Split failed: {e}", file=sys.stderr)
+        return 1
+    for path in shards:
+        print(path)
+    return 0
+
+def cli_retry_pushes(config):
+    queue = push_queue(config)
+    for outcome in queue.retry(force=True):
+        state = "pushed" if outcome["ok"] else f"failed: {outcome['error']}"
+        print(f"{outcome['repo']} {outcome['branch']}: {state}", file=sys.stderr)
+    remaining = queue.pending()
+    if remaining:
+        print(describe_pending_pushes(remaining))
+    return 1 if remaining else 0
+
+def drain_queued_pushes(results, config, timeout, log):
+    # Headless runs have no background retrier, so queued pushes from this
+    # run are retried in-line for up to timeout seconds.
+    repos = {os.path.normcase(os.path.abspath(r["repo"])) for r in results if r["status"] == "queued"}
+    if not repos or timeout <= 0:
+        return
+    log(f"Retrying queued pushes for up to {timeout:g}s")
+    pushed = {(os.path.normcase(o["repo"]), o["branch"]) for o in push_queue(config).drain(timeout, repos)}
+    for r in results:
+        if r["status"] == "queued" and (os.path.normcase(os.path.abspath(r["repo"])), r["branch"]) in pushed:
+            r["status"], r["error"] = "ok", None
+            r["pr_url"] = get_github_pr_url(r["repo"], r["branch"])
+
+def cli_main(argv=None, gui=None):
+    # gui starts the Tk app when no headless action is given; without it
+    # (python git_automation_core.py) one of the actions is required.
+    import argparse
+    parser = argparse.ArgumentParser(description="Git Automation App. Starts the GUI unless --manifest is given.")
+    parser.add_argument("--manifest", help="run headless over a JSON, YAML or CSV manifest of stories")
+    parser.add_argument("--workers", type=int, help="repositories processed concurrently (default: config max_workers or 4)")
+    parser.add_argument("--output", help="write the JSON summary to this file instead of stdout")
+    parser.add_argument("--username", help="changelog author / branch suffix (default: from config)")
+    parser.add_argument("--git-name", help="commit author name (default: from config)")
+    parser.add_argument("--git-email", help="commit author email (default: from config)")
+    parser.add_argument("--worktrees", action="store_true",
+                        help="run each story in its own git worktree instead of the repo's checkout")
+    parser.add_argument("--clone", metavar="URL", help="clone URL into --dest using the local mirror cache, then exit")
+    parser.add_argument("--dest", help="destination folder for --clone (default: current folder)")
+    parser.add_argument("--clone-mode", choices=[m for m, _ in CLONE_MODES], default="full")
+    parser.add_argument("--no-mirror", action="store_true", help="neither use nor update the mirror cache")
+    parser.add_argument("--trace-summary", action="store_true",
+                        help="print p50/p95 timings per step from the trace log, then exit")
+    parser.add_argument("--since-days", type=float, help="only summarize runs from the last N days")
+    parser.add_argument("--split-changelog", metavar="MASTER",
+                        help="move MASTER's changeSets into monthly or size-capped child changelogs, then exit")
+    parser.add_argument("--shard-by", choices=SHARD_MODES[1:], default="monthly")
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_SHARD_MAX_BYTES, help="shard size cap for --shard-by size")
+    parser.add_argument("--logical-path",
+                        help="logicalFilePath stamped on the shards so DATABASECHANGELOG rows keep matching")
+    parser.add_argument("--retry-pushes", action="store_true",
+                        help="push every branch in the push queue now, print what is still pending, then exit")
+    parser.add_argument("--push-wait", type=float,
+                        help="seconds to keep retrying failed pushes of a --manifest run (default: config push_queue_wait or 120)")
+    args = parser.parse_args(argv)
+    config = load_config()
+    configure_tracing(config)
+    if args.trace_summary:
+        return cli_trace_summary(args, config)
+    if args.clone:
+        return cli_clone(args, config)
+    if args.split_changelog:
+        return cli_split_changelog(args)
+    if args.retry_pushes:
+        return cli_retry_pushes(config)
+    if not args.manifest:
+        if gui is None:
+            parser.error("one of --manifest, --clone, --split-changelog, --trace-summary or --retry-pushes is required")
+        gui()
+        return 0
+
+    settings = {
+        "username": args.username or config.get("username"),
+        "git_name": args.git_name or config.get("git_name"),
+        "git_email": args.git_email or config.get("git_email"),
+    }
+    missing = [k for k, v in settings.items() if not v]
+    if missing:
+        parser.error(f"missing {', '.join(missing)}; pass them as options or run the GUI once to set them up")
+    try:
+        entries = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error(f"cannot read manifest: {e}")
+    settings.update(story_settings(config))
+    settings["worktrees"] = args.worktrees or settings["worktrees"]
+
+    log_lock = threading.Lock()
+    def log(line):
+        with log_lock:
+            print(line, file=sys.stderr, flush=True)
+    workers = args.workers or config.get("max_workers", 4)
+    results = run_manifest(entries, settings, workers, log)
+    wait = args.push_wait if args.push_wait is not None else config.get("push_queue_wait", 120)
+    drain_queued_pushes(results, config, wait, log)
+    log(format_results_table(results))
+    summary = {
+        "total": len(results),
+        "succeeded": sum(1 for r in results if r["status"] == "ok"),
+        "failed": sum(1 for r in results if r["status"] != "ok"),
+        "results": results,
+    }
+    text = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0 if summary["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(cli_main())
@@ -0,0 +1,33 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IDENTITY = ["-c", "user.name=Test", "-c", "user.email=test@example.com"]
+
+def git(*args, cwd=None):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+@pytest.fixture
+def origin(tmp_path):
+    # A bare origin with a dev branch holding one commit.
+    path = str(tmp_path / "origin.git")
+    seed = str(tmp_path / "seed")
+    git("init", "-q", "--bare", path)
+    git("init", "-q", "-b", "dev", seed)
+    with open(os.path.join(seed, "README"), "w") as f:
+        f.write("seed\n")
+    git("add", "README", cwd=seed)
+    git(*IDENTITY, "commit", "-q", "-m", "seed", cwd=seed)
+    git("push", "-q", path, "dev", cwd=seed)
+    git("symbolic-ref", "HEAD", "refs/heads/dev", cwd=path)
+    return path
+
+@pytest.fixture
+def clone(origin, tmp_path):
+    path = str(tmp_path / "clone")
+    git("clone", "-q", "--branch", "dev", origin, path)
+    return path
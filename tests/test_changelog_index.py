@@ -0,0 +1,87 @@
+import os
+
+import git_automation_core as core
+
+HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n<databaseChangeLog xmlns="http://www.liquibase.org/xml/ns/dbchangelog">\n'
+TAIL = "\n</databaseChangeLog>\n"
+
+def changeset(changeset_id, author="dev"):
+    return (f'    <changeSet id="{changeset_id}" author="{author}">\n'
+            f'        <sqlFile path="sql/{changeset_id}.sql"/>\n    </changeSet>\n')
+
+def write_changelog(path, ids):
+    with open(path, "w", newline="") as f:
+        f.write(HEAD + "".join(changeset(i) for i in ids) + TAIL)
+
+def track_parsing(monkeypatch):
+    # Records full rebuilds and every changeSet that gets indexed.
+    seen = {"builds": 0, "indexed": []}
+    build = core.build_changelog_index
+    index = core.index_changeset
+    def counting_build(conn, path):
+        seen["builds"] += 1
+        build(conn, path)
+    def counting_index(conn, elem, position):
+        seen["indexed"].append(elem.get("id"))
+        index(conn, elem, position)
+    monkeypatch.setattr(core, "build_changelog_index", counting_build)
+    monkeypatch.setattr(core, "index_changeset", counting_index)
+    return seen
+
+def resolve(path, base_id):
+    return core.resolve_changeset_id(path, base_id, "dev", [f"sql/{base_id}.sql"])
+
+def test_index_builds_once_and_extends_on_append(tmp_path, monkeypatch):
+    path = str(tmp_path / "changelog.xml")
+    write_changelog(path, [f"c{n}" for n in range(50)])
+    seen = track_parsing(monkeypatch)
+    assert resolve(path, "c7") == ("c7_2", {"sql/c7.sql": ["c7"]})
+    assert seen["builds"] == 1
+    core.insert_changelog_entry(path, changeset("story"))
+    seen["indexed"].clear()
+    assert resolve(path, "story") == ("story_2", {"sql/story.sql": ["story"]})
+    assert seen == {"builds": 1, "indexed": []}
+
+def test_checking_out_the_base_version_reuses_its_index(tmp_path, monkeypatch):
+    path = str(tmp_path / "changelog.xml")
+    ids = [f"c{n}" for n in range(50)]
+    write_changelog(path, ids)
+    resolve(path, "c0")
+    core.insert_changelog_entry(path, changeset("story"))
+    seen = track_parsing(monkeypatch)
+    # Back on dev: the file is exactly the version the index was built on.
+    write_changelog(path, ids)
+    assert resolve(path, "story") == ("story", {})
+    assert seen == {"builds": 0, "indexed": []}
+    # dev moves on with other people's changeSets: only those are parsed.
+    write_changelog(path, ids + ["other1", "other2"])
+    assert resolve(path, "other2") == ("other2_2", {"sql/other2.sql": ["other2"]})
+    assert seen == {"builds": 0, "indexed": ["other1", "other2"]}
+    # And the story branch, rebased on the old base, reuses it again.
+    write_changelog(path, ids + ["story"])
+    assert resolve(path, "other1") == ("other1", {})
+    assert resolve(path, "story") == ("story_2", {"sql/story.sql": ["story"]})
+    assert seen == {"builds": 0, "indexed": ["other1", "other2", "story"]}
+
+def test_edited_history_rebuilds_the_index(tmp_path, monkeypatch):
+    path = str(tmp_path / "changelog.xml")
+    write_changelog(path, ["c0", "c1", "c2"])
+    resolve(path, "c0")
+    seen = track_parsing(monkeypatch)
+    write_changelog(path, ["c0", "renamed", "c2"])
+    assert resolve(path, "c1") == ("c1", {})
+    assert resolve(path, "renamed")[0] == "renamed_2"
+    assert seen["builds"] == 1
+    assert os.path.exists(core.changelog_index_path(path))
+
+def test_shards_are_only_checked_when_sharding_is_on(tmp_path):
+    master = str(tmp_path / "changelog.xml")
+    with open(master, "w", newline="") as f:
+        f.write(HEAD + '    <include file="changelog.part-0001.xml" relativeToChangelogFile="true"/>' + TAIL)
+    shard = str(tmp_path / "changelog.part-0001.xml")
+    write_changelog(shard, ["c0"])
+    assert core.changelog_family(master, "off") == [master]
+    assert core.resolve_changeset_id(core.changelog_family(master, "off"), "c0", "dev", [])[0] == "c0"
+    assert not os.path.exists(core.changelog_index_path(shard))
+    assert core.changelog_family(master, "size") == [master, shard]
+    assert core.resolve_changeset_id(core.changelog_family(master, "size"), "c0", "dev", [])[0] == "c0_2"
@@ -0,0 +1,68 @@
+import os
+
+import git_automation_core as core
+from conftest import git, IDENTITY
+
+def count_objects(repo):
+    # Loose plus packed objects actually present in the clone.
+    stats = dict(line.split(": ") for line in git("count-objects", "-v", cwd=repo).splitlines())
+    return int(stats["count"]) + int(stats["in-pack"])
+
+def make_history(origin, tmp_path, commits=5):
+    # Rewrites one file, so older blob versions are only needed by a full clone.
+    work = str(tmp_path / "work")
+    git("clone", "-q", "--branch", "dev", origin, work)
+    for n in range(commits):
+        with open(os.path.join(work, "data.txt"), "w") as f:
+            f.write(f"content {n}\n" * 100)
+        git("add", "-A", cwd=work)
+        git(*IDENTITY, "commit", "-q", "-m", f"commit {n}", cwd=work)
+    git("push", "-q", "origin", "dev", cwd=work)
+    git("config", "uploadpack.allowFilter", "true", cwd=origin)
+    git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=origin)
+
+def test_reference_is_only_used_for_full_clones(tmp_path):
+    mirror = str(tmp_path)
+    for mode, _ in core.CLONE_MODES:
+        args = core.clone_steps("file:///x/repo.git", str(tmp_path / mode), mode, mirror)[0]["args"]
+        assert ("--dissociate" in args) == (mode == "full")
+
+def test_blobless_clone_with_mirror_stays_blobless(origin, tmp_path):
+    make_history(origin, tmp_path)
+    url = "file://" + origin
+    cache_root = str(tmp_path / "cache")
+    ok, out = core.update_mirror(url, cache_root)
+    assert ok, out
+    mirror = core.mirror_path_for(url, cache_root)
+
+    clones = {}
+    for mode in ("full", "blobless"):
+        target = str(tmp_path / mode)
+        ok, results = core.run_steps(core.clone_steps(url, target, mode, mirror))
+        assert ok, results
+        clones[mode] = target
+    assert git("config", "remote.origin.promisor", cwd=clones["blobless"]).strip() == "true"
+    assert count_objects(clones["blobless"]) < count_objects(clones["full"])
+    assert not os.path.exists(os.path.join(clones["full"], ".git", "objects", "info", "alternates"))
+
+def test_mirror_is_seeded_from_a_full_clone(origin, tmp_path):
+    make_history(origin, tmp_path)
+    git("branch", "feature", "dev", cwd=origin)
+    url = "file://" + origin
+    cache_root = str(tmp_path / "cache")
+    seed = str(tmp_path / "fresh")
+    ok, results = core.run_steps(core.clone_steps(url, seed, "full"))
+    assert ok, results
+    ok, out = core.update_mirror(url, cache_root, seed)
+    assert ok, out
+    mirror = core.mirror_path_for(url, cache_root)
+    assert git("--git-dir", mirror, "config", "remote.origin.url").strip() == url
+    refs = "for-each-ref", "--format=%(refname) %(objectname)"
+    assert git("--git-dir", mirror, *refs) == git(*refs, cwd=origin)
+    assert count_objects(mirror) == count_objects(seed)
+    assert not os.path.exists(os.path.join(mirror, "objects", "info", "alternates"))
+    # Later updates fetch from the remote as usual.
+    git("branch", "-D", "feature", cwd=origin)
+    ok, out = core.update_mirror(url, cache_root, seed)
+    assert ok, out
+    assert git("--git-dir", mirror, *refs) == git(*refs, cwd=origin)
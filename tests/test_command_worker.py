@@ -0,0 +1,113 @@
+import sys
+import time
+
+import pytest
+
+import git_automation_core as core
+
+def drain(worker, timeout=30):
+    # Collects events the way the Tk loop polls them, until "done".
+    events = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            event = worker.events.get(timeout=0.1)
+        except core.queue.Empty:
+            continue
+        events.append(event)
+        if event[0] == "done":
+            return events
+    raise AssertionError(f"worker did not finish: {events}")
+
+def process_gone(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] == "Z"
+    except FileNotFoundError:
+        return True
+
+def test_steps_emit_step_line_and_done_events(clone):
+    worker = core.CommandWorker()
+    done = []
+    worker.run([
+        core.git_step(["git", "fetch", "origin"], clone),
+        core.git_step(["git", "log", "--format=%s", "-1"], clone),
+    ], done.append)
+    events = drain(worker)
+    kinds = [kind for kind, _, _ in events]
+    assert kinds.count("step") == 2
+    assert ("line", "git log --format=%s -1", "seed") in events
+    assert kinds[-1] == "done"
+    on_done, (ok, results) = events[-1][1], events[-1][2]
+    assert ok and on_done == done.append
+    assert [success for _, success, _ in results] == [True, True]
+
+def test_failing_step_stops_the_run(clone):
+    worker = core.CommandWorker()
+    worker.run([
+        core.git_step(["git", "checkout", "no-such-branch"], clone, "Checkout failed."),
+        core.git_step(["git", "status"], clone),
+    ])
+    events = drain(worker)
+    failed = [payload for kind, _, payload in events if kind == "failed"]
+    assert len(failed) == 1 and failed[0].startswith("Checkout failed.\n")
+    ok, results = events[-1][2]
+    assert not ok
+    assert len(results) == 1
+    assert [kind for kind, _, _ in events].count("step") == 1
+
+def test_run_steps_headless_against_bare_origin(clone):
+    ok, results = core.run_steps(
+        core.prepare_branch_steps(clone, "S-1_test")
+        + [core.git_step(["git", "rev-parse", "--abbrev-ref", "HEAD"], clone)]
+    )
+    assert ok
+    assert results[-1][2].strip() == "S-1_test"
+
+@pytest.mark.skipif(sys.platform != "linux", reason="checks the process group through /proc")
+def test_cancel_kills_the_whole_process_group(tmp_path):
+    # The child forks a grandchild, like git does with its transport
+    # helpers; cancelling must take down both.
+    script = "import subprocess, sys, time; p = subprocess.Popen(['sleep', '60']); print(p.pid, flush=True); time.sleep(60)"
+    worker = core.CommandWorker()
+    worker.run([core.git_step([sys.executable, "-c", script], str(tmp_path)), core.git_step(["git", "--version"], None)])
+    grandchild = None
+    deadline = time.monotonic() + 10
+    while grandchild is None and time.monotonic() < deadline:
+        try:
+            kind, _, payload = worker.events.get(timeout=0.1)
+        except core.queue.Empty:
+            continue
+        if kind == "line":
+            grandchild = int(payload)
+    assert grandchild is not None
+    started = time.monotonic()
+    worker.cancel()
+    events = drain(worker, timeout=10)
+    assert time.monotonic() - started < 5
+    assert "cancelled" in [kind for kind, _, _ in events]
+    ok, results = events[-1][2]
+    assert not ok and len(results) == 1
+    deadline = time.monotonic() + 5
+    while not process_gone(grandchild) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert process_gone(grandchild)
+
+def test_spawns_are_counted_per_run(clone):
+    first, second = core.new_trace("story", clone), core.new_trace("story", clone)
+    core.run_steps([core.git_step(["git", "status"], clone)] * 3, trace=first)
+    core.run_steps([core.git_step(["git", "status"], clone)], trace=second)
+    core.run_cmd(["git", "status"], clone)
+    assert core.spawn_stats(first)["count"] == 3
+    assert core.spawn_stats(second)["count"] == 1
+    assert core.spawn_stats(first)["seconds"] > 0
+
+def test_call_runs_off_the_calling_thread():
+    worker = core.CommandWorker()
+    caller = core.threading.get_ident()
+    worker.call(lambda: core.threading.get_ident(), on_done="marker")
+    assert drain(worker)[-1] == ("done", "marker", (True, worker._thread.ident))
+    assert worker._thread.ident != caller
+    worker.call(lambda: 1 / 0)
+    kind, on_done, (ok, result) = drain(worker)[-1]
+    assert ok and isinstance(result, ZeroDivisionError)
@@ -0,0 +1,19 @@
+import git_automation_core as core
+
+def test_default_interval_is_within_max_age():
+    interval, max_age = core.prefetch_settings({})
+    assert 0 < interval < max_age
+
+def test_max_age_follows_a_longer_interval():
+    assert core.prefetch_settings({"prefetch_interval": 600}) == (600, 600 + core.PREFETCH_FETCH_SLACK)
+    assert core.prefetch_settings({"prefetch_interval": 0}) == (0, core.PREFETCH_MAX_AGE)
+
+def test_explicit_max_age_wins():
+    assert core.prefetch_settings({"prefetch_interval": 600, "prefetch_max_age": 60}) == (600, 60)
+
+def test_prefetched_repo_counts_as_fresh(clone):
+    prefetcher = core.Prefetcher(0)
+    assert not prefetcher.is_fresh(clone, 120)
+    prefetcher.mark_fresh(clone)
+    assert prefetcher.is_fresh(clone, 120)
+    assert prefetcher.age(clone) < 1
@@ -0,0 +1,76 @@
+import json
+
+import git_automation_core as core
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def errors(issues):
+    return [item["message"] for item in issues if item["severity"] == "error"]
+
+def test_sql_summary_finds_objects_outside_strings_and_comments(tmp_path):
+    path = write(tmp_path, "up.sql", (
+        "-- create table ignored(x int);\n"
+        "CREATE OR REPLACE TABLE db.s.\"Orders\" (id int, note varchar default 'a;b');\n"
+        "/* drop view v; */\n"
+        "create procedure p() returns int language sql as $$ begin return 1; end $$;\n"
+        "create index if not exists ix_t on t (id);\n"
+    ))
+    summary = core.sql_summary(path)
+    assert summary["statements"] == 3
+    assert [(o["verb"], o["type"], o["name"], o["line"]) for o in summary["objects"]] == [
+        ("CREATE", "TABLE", "Orders", 2), ("CREATE", "PROCEDURE", "P", 4), ("CREATE", "INDEX", "IX_T", 5),
+    ]
+    assert summary["issues"] == []
+
+def test_sql_summary_reports_tokenizer_errors(tmp_path):
+    cases = {
+        "create procedure p() as $$ begin\n": "Unterminated $$ body",
+        "select 'open;\n": "Unterminated string literal",
+        "create table t (x int); /* never closed\n": "Unterminated block comment",
+        "create table t (x int;\n": "1 unclosed '(' in statement",
+        "-- only a comment\n": "No SQL statements",
+        "": "No SQL statements",
+    }
+    for n, (text, message) in enumerate(cases.items()):
+        assert errors(core.sql_summary(write(tmp_path, f"{n}.sql", text))["issues"]) == [message], text
+
+def test_rename_pair_only_warns(tmp_path):
+    up = write(tmp_path, "up.sql", "ALTER TABLE OLD_T RENAME TO NEW_T;\n")
+    down = write(tmp_path, "down.sql", "ALTER TABLE NEW_T RENAME TO OLD_T;\n")
+    issues, _ = core.run_preflight([(up, down)])
+    assert [(item["severity"], item["path"]) for item in issues] == [("warning", up), ("warning", down)]
+    assert core.preflight_totals({}, issues) == 0
+
+def test_matching_pair_is_clean(tmp_path):
+    up = write(tmp_path, "up.sql", "create table t (id int);\n")
+    down = write(tmp_path, "down.sql", "DROP TABLE IF EXISTS T;\n")
+    assert core.run_preflight([(up, down)]) == ([], 0)
+
+def test_ge_summary(tmp_path):
+    good = write(tmp_path, "suite.json", json.dumps({
+        "expectation_suite_name": "orders",
+        "expectations": [{"expectation_type": "expect_column_to_exist", "kwargs": {"column": "id"}}],
+    }))
+    assert core.ge_summary(good, "expectation") == {"issues": []}
+    bad = write(tmp_path, "bad.json", json.dumps({"expectations": [{"kwargs": {}}, "x"]}))
+    assert errors(core.ge_summary(bad, "expectation")["issues"]) == [
+        "Missing 'expectation_suite_name'", "'expectations' item 1 has no 'expectation_type'",
+        "'expectations' item 2 must be an object",
+    ]
+    empty = write(tmp_path, "checkpoint.json", json.dumps({"name": "cp", "validations": []}))
+    assert [(i["severity"], i["message"]) for i in core.ge_summary(empty, "checkpoint")["issues"]] == [
+        ("warning", "'validations' is empty"),
+    ]
+    broken = write(tmp_path, "broken.json", '{"name": ')
+    [issue] = core.ge_summary(broken, "checkpoint")["issues"]
+    assert issue["severity"] == "error" and issue["message"].startswith("Invalid checkpoint file")
+
+def test_manifest_entry_can_turn_preflight_off(tmp_path):
+    entry = core.normalize_manifest_entry({
+        "story_id": "S-1", "commit_headline": "h", "repo": ".", "up_file": "u.sql", "down_file": "d.sql",
+        "target_folder": "db", "preflight": "no",
+    }, str(tmp_path), 1)
+    assert entry["preflight"] is False
@@ -0,0 +1,112 @@
+import os
+import stat
+import time
+
+import git_automation_core as core
+from conftest import git, IDENTITY
+
+def reject_branch(origin, branch):
+    # The update hook runs once per ref, so only this branch is refused and
+    # the rest of a multi-refspec push goes through.
+    hook = os.path.join(origin, "hooks", "update")
+    with open(hook, "w") as f:
+        f.write(f'#!/bin/sh\n[ "$1" != "refs/heads/{branch}" ] || {{ echo "{branch} is frozen" >&2; exit 1; }}\n')
+    os.chmod(hook, os.stat(hook).st_mode | stat.S_IXUSR)
+
+def allow_all(origin):
+    os.remove(os.path.join(origin, "hooks", "update"))
+
+def commit_branch(clone, branch):
+    git("checkout", "-q", "-b", branch, "dev", cwd=clone)
+    with open(os.path.join(clone, f"{branch}.txt"), "w") as f:
+        f.write(branch + "\n")
+    git("add", "-A", cwd=clone)
+    git(*IDENTITY, "commit", "-q", "-m", branch, cwd=clone)
+    git("checkout", "-q", "dev", cwd=clone)
+
+def remote_branches(origin):
+    return git("for-each-ref", "--format=%(refname:short)", "refs/heads", cwd=origin).split()
+
+def test_parse_push_porcelain():
+    output = (
+        "To /tmp/origin.git\n"
+        "*\trefs/heads/a:refs/heads/a\t[new branch]\n"
+        "=\trefs/heads/b:refs/heads/b\t[up to date]\n"
+        "!\trefs/heads/c:refs/heads/c\t[remote rejected] (hook declined)\n"
+        "Done\n"
+    )
+    assert core.parse_push_porcelain(output) == {
+        "refs/heads/a": (True, "[new branch]"),
+        "refs/heads/b": (True, "[up to date]"),
+        "refs/heads/c": (False, "[remote rejected] (hook declined)"),
+    }
+
+def test_one_rejected_ref_stays_queued_with_backoff(origin, clone, tmp_path):
+    for branch in ("good", "bad"):
+        commit_branch(clone, branch)
+    reject_branch(origin, "bad")
+    queue = core.PushQueue(str(tmp_path / "queue.json"), base_delay=10, max_delay=25)
+    for branch in ("good", "bad"):
+        queue.add(clone, branch, "error: failed to push some refs")
+    started = time.time()
+    outcomes = {o["branch"]: o for o in queue.retry(force=True)}
+    assert outcomes["good"]["ok"] and outcomes["good"]["error"] is None
+    assert not outcomes["bad"]["ok"] and "rejected" in outcomes["bad"]["error"]
+    assert remote_branches(origin) == ["dev", "good"]
+    [entry] = queue.pending()
+    assert entry["branch"] == "bad" and entry["attempts"] == 2
+    assert started + 20 <= entry["next_try"] <= time.time() + 20
+    assert [queue.delay(n) for n in (1, 2, 3, 4)] == [10, 20, 25, 25]
+    # Not due yet, so an unforced retry leaves it alone.
+    assert queue.retry() == []
+    assert queue.pending()[0]["attempts"] == 2
+
+def test_queue_persists_across_instances(origin, clone, tmp_path):
+    commit_branch(clone, "bad")
+    reject_branch(origin, "bad")
+    path = str(tmp_path / "queue.json")
+    core.PushQueue(path).add(clone, "bad", "error: failed to push some refs")
+    restarted = core.PushQueue(path)
+    assert [e["branch"] for e in restarted.pending()] == ["bad"]
+    # The stored next_try carries over, so it is not due yet.
+    assert restarted.retry() == []
+    allow_all(origin)
+    pushed = restarted.retry(force=True)
+    assert [(o["branch"], o["ok"]) for o in pushed] == [("bad", True)]
+    assert core.PushQueue(path).pending() == []
+    assert "bad" in remote_branches(origin)
+
+def test_drain_gives_up_at_timeout(origin, clone, tmp_path):
+    commit_branch(clone, "bad")
+    reject_branch(origin, "bad")
+    queue = core.PushQueue(str(tmp_path / "queue.json"), base_delay=60)
+    queue.add(clone, "bad", "error: failed to push some refs")
+    started = time.monotonic()
+    assert queue.drain(timeout=1) == []
+    assert time.monotonic() - started < 1
+    assert queue.pending()[0]["attempts"] == 1
+
+def test_run_story_sets_pr_url_only_once_pushed(origin, clone, tmp_path):
+    # get_github_pr_url sees a GitHub remote; insteadOf sends fetches and
+    # pushes to the local origin.
+    git("remote", "set-url", "origin", "https://github.com/acme/db.git", cwd=clone)
+    git("config", "url." + origin + ".insteadOf", "https://github.com/acme/db.git", cwd=clone)
+    os.makedirs(os.path.join(clone, "db"))
+    for name in ("V1_up.sql", "V1_down.sql"):
+        with open(tmp_path / name, "w") as f:
+            f.write("select 1;\n")
+    entry = core.normalize_manifest_entry({
+        "story_id": "S-9", "commit_headline": "add v1", "repo": clone, "mode": "DB Objects",
+        "up_file": "V1_up.sql", "down_file": "V1_down.sql", "target_folder": "db",
+    }, str(tmp_path), 1)
+    config = {"push_queue_file": str(tmp_path / "queue.json"), "push_retry_base": 0}
+    settings = dict(core.story_settings(config), username="u", git_name="u", git_email="u@example.com", preflight=False)
+    branch = core.story_branch_name("S-9", "u")
+    reject_branch(origin, branch)
+    [result] = core.run_manifest([entry], settings)
+    assert result["status"] == "queued" and result["pr_url"] is None
+    assert "failed to push" in core.result_outcome(result)
+    allow_all(origin)
+    core.drain_queued_pushes([result], config, 5, lambda line: None)
+    assert result["status"] == "ok" and result["error"] is None
+    assert result["pr_url"] == f"https://github.com/acme/db/pull/new/{branch}"
@@ -0,0 +1,41 @@
+import sys
+
+import git_automation_core as core
+
+def run_script(code):
+    lines, progress = [], []
+    ok, out = core.stream_cmd(
+        [sys.executable, "-c", code], on_line=lines.append, on_progress=lambda *p: progress.append(p),
+    )
+    assert ok
+    return out, lines, progress
+
+def test_parse_git_progress():
+    assert core.parse_git_progress("Receiving objects:  45% (450/1000)") == ("Receiving objects", 45)
+    assert core.parse_git_progress("remote: Counting objects: 100% (3/3), done.") == ("Counting objects", 100)
+    assert core.parse_git_progress("error: hook said no") is None
+    assert core.parse_git_progress("") is None
+
+def test_crlf_lines_are_kept():
+    out, lines, _ = run_script(r'import sys; sys.stdout.buffer.write(b"error: hook said no\r\nsecond\n")')
+    assert lines == ["error: hook said no", "second"]
+    assert out == "error: hook said no\nsecond\n"
+
+def test_progress_redraws_are_reported_but_not_kept():
+    out, lines, progress = run_script(
+        r'import sys; sys.stdout.buffer.write(b"Receiving objects:  50% (1/2)\rReceiving objects: 100% (2/2), done.\n'
+        r'last\r")'
+    )
+    assert progress == [("Receiving objects", 50), ("Receiving objects", 100)]
+    assert lines == ["Receiving objects: 100% (2/2), done."]
+    assert out == "Receiving objects: 100% (2/2), done.\n"
+
+def test_crlf_split_across_reads():
+    # The \r arrives in one read and the \n in the next.
+    out, lines, _ = run_script(
+        "import sys, time\n"
+        "sys.stdout.buffer.write(b'first\\r'); sys.stdout.flush(); time.sleep(0.2)\n"
+        "sys.stdout.buffer.write(b'\\nsecond')\n"
+    )
+    assert lines == ["first", "second"]
+    assert out == "first\nsecond\n"
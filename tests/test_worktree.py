@@ -0,0 +1,42 @@
+import os
+
+import git_automation_core as core
+from conftest import git
+
+def story_entry(clone, tmp_path, story):
+    for name in ("T1_up.sql", "T1_down.sql"):
+        with open(tmp_path / name, "w") as f:
+            f.write("select 1;\n")
+    return core.normalize_manifest_entry({
+        "story_id": story, "commit_headline": "add t1", "repo": clone, "mode": "DB Objects",
+        "up_file": "T1_up.sql", "down_file": "T1_down.sql", "target_folder": "db/tables", "worktree": True,
+    }, str(tmp_path), 1)
+
+def worktree_settings(tmp_path):
+    return {
+        "worktrees": True, "cache_dir": str(tmp_path / "cache"), "preflight": False,
+        "username": "u", "git_name": "u", "git_email": "u@example.com",
+        "push_queue_file": str(tmp_path / "queue.json"),
+    }
+
+def test_untracked_target_folder_is_created_in_the_slot(origin, clone, tmp_path):
+    # db/tables exists only in the developer's checkout, so origin/dev and
+    # therefore the worktree slot do not have it.
+    os.makedirs(os.path.join(clone, "db", "tables"))
+    [result] = core.run_manifest([story_entry(clone, tmp_path, "S-2")], worktree_settings(tmp_path))
+    assert result["status"] == "ok", result["error"]
+    assert result["worktree"] and not os.path.samefile(result["worktree"], clone)
+    branch = core.story_branch_name("S-2", "u")
+    files = git("ls-tree", "-r", "--name-only", branch, cwd=origin).split()
+    assert files == ["README", "db/tables/T1_down.sql", "db/tables/T1_up.sql"]
+    # The developer's checkout is untouched.
+    assert os.listdir(os.path.join(clone, "db", "tables")) == []
+    assert git("branch", "--show-current", cwd=clone).strip() == "dev"
+
+def test_slots_are_reused_between_stories(origin, clone, tmp_path):
+    settings = worktree_settings(tmp_path)
+    first, = core.run_manifest([story_entry(clone, tmp_path, "S-3")], settings)
+    second, = core.run_manifest([story_entry(clone, tmp_path, "S-4")], settings)
+    assert first["status"] == second["status"] == "ok"
+    assert first["worktree"] == second["worktree"]
+    assert not os.path.exists(first["worktree"] + ".lock")